@@ -0,0 +1,39 @@
+# Copyright (c) 2025
+# Manuel Cherep <mcherep@mit.edu>
+# Nikhil Singh <nikhil.u.singh@dartmouth.edu>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This package contains interventions (choice architectures) applied to pages from config files.
+"""
+
+from bs4 import BeautifulSoup
+
+
+def get_soup(html: bytes | str | BeautifulSoup) -> BeautifulSoup:
+    """
+    Parses the HTML, unless it was already parsed by the caller.
+
+    This lets a router (e.g. ABxLabShopTask.process_html) hand its tree to the
+    intervention it dispatches to, so each request is only parsed once.
+    """
+    if isinstance(html, BeautifulSoup):
+        return html
+    return BeautifulSoup(html, "lxml")
@@ -26,17 +26,18 @@ This module contains interventions to modify arbitrary pages from config files.
 
 import logging
 from bs4 import BeautifulSoup
+from abxlab.choices import get_soup
 
 
 def subtitle(
-    original_html: bytes,
+    original_html: bytes | BeautifulSoup,
     value: str,
     elem_id: str = "title",
     insert_elem_type: str = "h2"
 ) -> tuple[str, dict]:
     """Inserts a subtitle below the product title."""
 
-    soup = BeautifulSoup(original_html, "lxml")
+    soup = get_soup(original_html)
 
     element = soup.find(attrs={"id": elem_id})
 
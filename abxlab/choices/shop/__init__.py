@@ -0,0 +1,56 @@
+# Copyright (c) 2025
+# Manuel Cherep <mcherep@mit.edu>
+# Nikhil Singh <nikhil.u.singh@dartmouth.edu>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This package contains interventions (choice architectures) for the shop pages.
+"""
+
+
+# Styles of the elements inserted by the interventions, shared by all pages
+_BADGE_STYLE = (
+    "display: inline-block; "
+    "padding: 4px 8px; "
+    "border: 1px solid rgb(30, 109, 182); "
+    "border-radius: 12px; "
+    "color: rgb(30, 109, 182); "
+)
+
+# Subtitles are smaller in product lists (home and category pages) than on product pages
+SUBTITLE_STYLE = _BADGE_STYLE + "font-size: 0.9em;"
+PRODUCT_SUBTITLE_STYLE = _BADGE_STYLE + "font-size: 2em;"
+
+STOCK_STYLE = (
+    "display: inline-block; "
+    "padding: 4px 8px; "
+    "margin-top: 10px; "
+    "border: 1px solid rgb(30, 109, 182); "
+    "border-radius: 2px; "
+    "color: rgb(30, 109, 182); "
+    "font-size: 0.9em;"
+)
+
+RATING_STYLE = (
+    "display: inline-block; "
+    "margin-top: 4px; "
+    "margin-right: 10px; "
+    "color: rgb(251, 79, 31); "
+)
@@ -26,18 +26,20 @@ This module contains interventions to modify category pages from config files.
 
 import random
 from bs4 import BeautifulSoup
+from abxlab.choices import get_soup
+from abxlab.choices.shop import SUBTITLE_STYLE, RATING_STYLE
 from typing import Optional
 
 
 def subtitle(
-    original_html: bytes,
+    original_html: bytes | BeautifulSoup,
     value: str,
     elem_id: str = "product name product-item-name",
     product: Optional[str] = None
 ) -> tuple[str, dict]:
     """Inserts a subtitle below the product title."""
 
-    soup = BeautifulSoup(original_html, "lxml")
+    soup = get_soup(original_html)
 
     items = soup.select("li.item.product.product-item")
 
@@ -51,14 +53,7 @@ def subtitle(
     element = item.find("strong", class_=elem_id)
 
     span_tag = soup.new_tag("span", attrs={"class":"product-title-details"})
-    span_tag["style"] = (
-        "display: inline-block; "
-        "padding: 4px 8px; "
-        "border: 1px solid rgb(30, 109, 182); "
-        "border-radius: 12px; "
-        "color: rgb(30, 109, 182); "
-        "font-size: 0.9em;"
-    )
+    span_tag["style"] = SUBTITLE_STYLE
     span_tag.string = value
 
     element.insert_after(span_tag)
@@ -73,7 +68,7 @@ def subtitle(
 
 
 def stock(
-    original_html: bytes,
+    original_html: bytes | BeautifulSoup,
     value: str,
     elem_id: str = "product name product-item-name",
     product: Optional[str] = None
@@ -87,12 +82,12 @@ def stock(
 ################################################################################
 
 def rating(
-    original_html: bytes,
+    original_html: bytes | BeautifulSoup,
     elem_id: str = "rating-result"
 ) -> str:
     """Inserts the rating explicitly in percentage to avoid confusion with the stars by default."""
 
-    soup = BeautifulSoup(original_html, "lxml")
+    soup = get_soup(original_html)
 
     items = soup.select("li.item.product.product-item")
 
@@ -103,12 +98,7 @@ def rating(
             element = item.find("div", class_=elem_id)
 
             span_tag = soup.new_tag("span", attrs={"class":"product-rating-details"})
-            span_tag["style"] = (
-                "display: inline-block; "
-                "margin-top: 4px; "
-                "margin-right: 10px; "
-                "color: rgb(251, 79, 31); "
-            )
+            span_tag["style"] = RATING_STYLE
             span_tag.string = "Rating: " + rating["title"]
 
             element.insert_after(span_tag)
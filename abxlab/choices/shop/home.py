@@ -28,24 +28,26 @@ import random
 import abxlab.choices.shop.product
 import abxlab.choices.shop.category
 from bs4 import BeautifulSoup
+from abxlab.choices import get_soup
+from abxlab.choices.shop import SUBTITLE_STYLE, RATING_STYLE
 
 
 def subtitle(
-    original_html: bytes,
+    original_html: bytes | BeautifulSoup,
     value: str,
     elem_id: list[str] = "product-item-name"
 ) -> tuple[str, dict]:
     """Inserts a subtitle below the product title."""
 
-    soup = BeautifulSoup(original_html, "lxml")
+    soup = get_soup(original_html)
 
     if soup.find("meta", property="og:type", content="product"):
         # Page type is product
-        return abxlab.choices.shop.product.subtitle(original_html, value)
+        return abxlab.choices.shop.product.subtitle(soup, value)
 
     if soup.select_one("div.sidebar-main div.filter"):
         # Page type is category
-        return abxlab.choices.shop.category.subtitle(original_html, value)
+        return abxlab.choices.shop.category.subtitle(soup, value)
 
     if soup.title and soup.title.string.strip() == "One Stop Market":
         # Page type is home
@@ -58,14 +60,7 @@ def subtitle(
         element = item.find("strong", class_=elem_id)
 
         span_tag = soup.new_tag("span", attrs={"class":"product-title-details"})
-        span_tag["style"] = (
-            "display: inline-block; "
-            "padding: 4px 8px; "
-            "border: 1px solid rgb(30, 109, 182); "
-            "border-radius: 12px; "
-            "color: rgb(30, 109, 182); "
-            "font-size: 0.9em;"
-        )
+        span_tag["style"] = SUBTITLE_STYLE
         span_tag.string = value
 
         element.insert_after(span_tag)
@@ -82,7 +77,7 @@ def subtitle(
 
 
 def stock(
-    original_html: bytes,
+    original_html: bytes | BeautifulSoup,
     value: str,
     elem_ids: list[str] = ["product name product-item-name", "product-item-name"]
 ) -> tuple[str, dict]:
@@ -95,12 +90,12 @@ def stock(
 ################################################################################
 
 def rating(
-    original_html: bytes,
+    original_html: bytes | BeautifulSoup,
     elem_id: str = "rating-result"
 ) -> str:
     """Inserts the rating explicitly in percentage to avoid confusion with the stars by default."""
 
-    soup = BeautifulSoup(original_html, "lxml")
+    soup = get_soup(original_html)
 
     items = soup.select("li.product-item")
 
@@ -111,12 +106,7 @@ def rating(
             element = item.find("div", class_=elem_id)
 
             span_tag = soup.new_tag("span", attrs={"class":"product-rating-details"})
-            span_tag["style"] = (
-                "display: inline-block; "
-                "margin-top: 4px; "
-                "margin-right: 10px; "
-                "color: rgb(251, 79, 31); "
-            )
+            span_tag["style"] = RATING_STYLE
             span_tag.string = "Rating: " + rating["title"]
 
             element.insert_after(span_tag)
@@ -25,104 +25,91 @@ This module contains interventions to modify product pages from config files.
 """
 
 from bs4 import BeautifulSoup
+from abxlab.choices import get_soup
+from abxlab.choices.shop import PRODUCT_SUBTITLE_STYLE, STOCK_STYLE, RATING_STYLE
 
 
 def subtitle(
-    original_html: bytes,
+    original_html: bytes | BeautifulSoup,
     value: str,
     elem_id: str = "page-title-wrapper product"
 ) -> tuple[str, dict]:
     """Inserts a subtitle below the product title."""
 
-    soup = BeautifulSoup(original_html, "lxml")
-
-    element = soup.find("div", class_=elem_id)
-
-    span_tag = soup.new_tag("h2", attrs={"class":"product-title-details",
-                                         "visible":""})
-    span_tag["style"] = (
-        "display: inline-block; "
-        "padding: 4px 8px; "
-        "border: 1px solid rgb(30, 109, 182); "
-        "border-radius: 12px; "
-        "color: rgb(30, 109, 182); "
-        "font-size: 2em;"
-    )
-    span_tag.string = value
-
-    element.insert_after(span_tag)
+    soup = get_soup(original_html)
+    _insert_subtitle(soup, value, elem_id)
 
     modified_html = str(soup)
     return modified_html, {}
 
 
 def stock(
-    original_html: bytes,
+    original_html: bytes | BeautifulSoup,
     value: str,
     elem_id: str = "product-info-stock-sku"
 ) -> tuple[str, dict]:
     """Replaces stock information for the product."""
 
-    soup = BeautifulSoup(original_html, "lxml")
-
-    element = soup.find("div", class_=elem_id)
-
-    span_tag = soup.new_tag("span", attrs={"class":"product-stock-details"})
-    span_tag["style"] = (
-        "display: inline-block; "
-        "padding: 4px 8px; "
-        "margin-top: 10px; "
-        "border: 1px solid rgb(30, 109, 182); "
-        "border-radius: 2px; "
-        "color: rgb(30, 109, 182); "
-        "font-size: 0.9em;"
-    )
-    span_tag.string = value
-
-    element.insert_after(span_tag)
+    soup = get_soup(original_html)
+    _insert_stock(soup, value, elem_id)
 
     modified_html = str(soup)
     return modified_html, {}
 
 
 def price(
-    original_html: bytes,
+    original_html: bytes | BeautifulSoup,
     value: float
 ) -> str:
     """Replaces the product price."""
 
-    soup = BeautifulSoup(original_html, "lxml")
-
-    # Change price in span
-    price = soup.find("span", class_="price")
-    price.string = "$" + f"{value:.2f}"
-
-    # Change data-price-amount in price-wrapper
-    price_wrapper = soup.find("span", class_="price-wrapper")
-    if price_wrapper:
-        price_wrapper["data-price-amount"] = f"{value:.2f}"
+    soup = get_soup(original_html)
+    _replace_price(soup, value)
 
     modified_html = str(soup)
     return modified_html, {}
 
 
 def review_count(
-    original_html: bytes,
+    original_html: bytes | BeautifulSoup,
     value: int
 ) -> str:
     """Replaces the review count for the product."""
 
-    soup = BeautifulSoup(original_html, "lxml")
+    soup = get_soup(original_html)
+    _replace_review_count(soup, value)
 
-    # Change review count on the right next to rating
-    review_count_ratings = soup.find("span", itemprop="reviewCount")
-    if review_count_ratings:
-        review_count_ratings.string = str(value)
+    modified_html = str(soup)
+    return modified_html, {}
 
-    # Change review count in the tab at the bottom
-    review_count_tab = soup.find("span", class_="counter")
-    if review_count_tab:
-        review_count_tab.string = str(value)
+
+def apply(
+    original_html: bytes | BeautifulSoup,
+    subtitle: str | None = None,
+    stock: str | None = None,
+    price: float | None = None,
+    review_count: int | None = None,
+    add_rating: bool = False
+) -> tuple[str, dict]:
+    """
+    Applies several interventions with a single parse and serialization.
+
+    This is equivalent to chaining subtitle, stock, price, review_count (and
+    rating, if add_rating) on the same page, skipping the ones that are None.
+    """
+
+    soup = get_soup(original_html)
+
+    if subtitle is not None:
+        _insert_subtitle(soup, subtitle)
+    if stock is not None:
+        _insert_stock(soup, stock)
+    if price is not None:
+        _replace_price(soup, price)
+    if review_count is not None:
+        _replace_review_count(soup, review_count)
+    if add_rating:
+        _insert_rating(soup)
 
     modified_html = str(soup)
     return modified_html, {}
@@ -134,40 +121,25 @@ def review_count(
 ################################################################################
 
 def rating(
-    original_html: bytes,
+    original_html: bytes | BeautifulSoup,
     elem_id: str = "rating-summary"
 ) -> str:
     """Inserts the rating explicitly in percentage to avoid confusion with the stars by default."""
 
-    soup = BeautifulSoup(original_html, "lxml")
-
-    rating = soup.find("div", class_="rating-result")
-
-    if rating:
-        element = soup.find("div", class_=elem_id)
-
-        span_tag = soup.new_tag("span", attrs={"class":"product-rating-details"})
-        span_tag["style"] = (
-            "display: inline-block; "
-            "margin-top: 4px; "
-            "margin-right: 10px; "
-            "color: rgb(251, 79, 31); "
-        )
-        span_tag.string = "Rating: " + rating["title"]
-
-        element.insert_after(span_tag)
+    soup = get_soup(original_html)
+    _insert_rating(soup, elem_id)
 
     modified_html = str(soup)
     return modified_html
 
 
 def ablate(
-    original_html: bytes,
+    original_html: bytes | BeautifulSoup,
     elems: list[str] = ["product-reviews-summary", "price-box price-final_price"]
 ) -> str:
     """Removes specified elements from the product page."""
 
-    soup = BeautifulSoup(original_html, "lxml")
+    soup = get_soup(original_html)
 
     for elem in elems:
         element = soup.find("div", class_=elem)
@@ -176,3 +148,72 @@ def ablate(
 
     modified_html = str(soup)
     return modified_html
+
+
+################################################################################
+# Helpers below modify a parsed soup in place, so they can be combined (see apply)
+################################################################################
+
+def _insert_subtitle(
+    soup: BeautifulSoup,
+    value: str,
+    elem_id: str = "page-title-wrapper product"
+) -> None:
+    element = soup.find("div", class_=elem_id)
+
+    span_tag = soup.new_tag("h2", attrs={"class":"product-title-details",
+                                         "visible":""})
+    span_tag["style"] = PRODUCT_SUBTITLE_STYLE
+    span_tag.string = value
+
+    element.insert_after(span_tag)
+
+
+def _insert_stock(
+    soup: BeautifulSoup,
+    value: str,
+    elem_id: str = "product-info-stock-sku"
+) -> None:
+    element = soup.find("div", class_=elem_id)
+
+    span_tag = soup.new_tag("span", attrs={"class":"product-stock-details"})
+    span_tag["style"] = STOCK_STYLE
+    span_tag.string = value
+
+    element.insert_after(span_tag)
+
+
+def _replace_price(soup: BeautifulSoup, value: float) -> None:
+    # Change price in span
+    price = soup.find("span", class_="price")
+    price.string = "$" + f"{value:.2f}"
+
+    # Change data-price-amount in price-wrapper
+    price_wrapper = soup.find("span", class_="price-wrapper")
+    if price_wrapper:
+        price_wrapper["data-price-amount"] = f"{value:.2f}"
+
+
+def _replace_review_count(soup: BeautifulSoup, value: int) -> None:
+    # Change review count on the right next to rating
+    review_count_ratings = soup.find("span", itemprop="reviewCount")
+    if review_count_ratings:
+        review_count_ratings.string = str(value)
+
+    # Change review count in the tab at the bottom
+    review_count_tab = soup.find("span", class_="counter")
+    if review_count_tab:
+        review_count_tab.string = str(value)
+
+
+def _insert_rating(soup: BeautifulSoup, elem_id: str = "rating-summary") -> None:
+    rating = soup.find("div", class_="rating-result")
+
+    if rating:
+        element = soup.find("div", class_=elem_id)
+
+        span_tag = soup.new_tag("span", attrs={"class":"product-rating-details"})
+        span_tag["style"] = RATING_STYLE
+        span_tag.string = "Rating: " + rating["title"]
+
+        element.insert_after(span_tag)
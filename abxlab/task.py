@@ -211,18 +211,19 @@ class ABxLabShopTask(ABxLabTask):
 
         soup = BeautifulSoup(html, "lxml")
 
+        # The rating functions below modify this soup instead of parsing the page again
         # TODO: replace product_rating with a function from config
         if soup.find("meta", property="og:type", content="product"):
             # Page type is product
-            return product_rating(html)
+            return product_rating(soup)
 
         if soup.select_one("div.sidebar-main div.filter"):
             # Page type is category
-            return category_rating(html)
+            return category_rating(soup)
 
         if soup.title and soup.title.string.strip() == "One Stop Market":
             # Page type is home
-            return home_rating(html)
+            return home_rating(soup)
 
         return html
 
@@ -269,14 +270,14 @@ class StaticPageTask(AbstractBrowserTask):
 
         if soup.find("meta", property="og:type", content="product"):
             # Page type is product
-            return product_rating(html)
+            return product_rating(soup)
 
         if soup.select_one("div.sidebar-main div.filter"):
             # Page type is category
-            return category_rating(html)
+            return category_rating(soup)
 
         if soup.title and soup.title.string.strip() == "One Stop Market":
             # Page type is home
-            return home_rating(html)
+            return home_rating(soup)
 
         return html
@@ -54,10 +54,12 @@ def main(cfg: DictConfig):
     # Avoid LiteLLM extremely long logs
     os.environ["LITELLM_LOG"] = "INFO"
 
+    task_name = cfg.task.name
+    study_dir = (Path(cfg.experiment.root_dir) / task_name).absolute()
+
     # Check if we want to continue a previous experiment set
-    study_dir = (Path(cfg.experiment.root_dir) / cfg.task.name).absolute()
     if cfg.experiment.continue_from:
-        study_dir_from_prev = (Path(cfg.experiment.continue_from) / cfg.task.name).absolute()
+        study_dir_from_prev = (Path(cfg.experiment.continue_from) / task_name).absolute()
         if study_dir_from_prev.exists():
             # Check if the experiment ran *correctly*
             summary_info = glob.glob(os.path.join(study_dir_from_prev, "**", "*", "summary_info.json"), recursive=True)
@@ -66,10 +68,10 @@ def main(cfg: DictConfig):
                 summary_info = json.load(json_file)
 
             if (summary_info["err_msg"] is None) and (summary_info["stack_trace"] is None):
-                log.info("Skipping %s; it seems to have run correctly.", cfg.task.name)
+                log.info("Skipping %s; it seems to have run correctly.", task_name)
                 return 0
             else:
-                log.info("Re-running %s; it seems to have run incorrectly.", cfg.task.name)
+                log.info("Re-running %s; it seems to have run incorrectly.", task_name)
 
     # Instantiate agent and benchmark directly from Hydra configs
     agent = hydra.utils.instantiate(cfg.agent)
@@ -80,24 +82,26 @@ def main(cfg: DictConfig):
         ]
     )
 
+    # Resolve the task once, instead of every time the env is instantiated
+    task_entrypoint = getattr(
+        abxlab.task,
+        cfg.task.entrypoint.replace("abxlab.task.", "")
+    )
+    task_kwargs = {
+        **OmegaConf.to_container(cfg.task, resolve=True),
+        "study_dir": study_dir
+    }
+
     # Register the env here, so we don't need to reach into BrowserGym
     gym.register(
-        id=f"browsergym/abxlab.{cfg.task.name}",
+        id=f"browsergym/abxlab.{task_name}",
         entry_point=lambda *env_args, **env_kwargs: ABxLabBrowserEnv(
-            task_entrypoint=getattr(
-                abxlab.task,
-                cfg.task.entrypoint.replace("abxlab.task.", "")
-            ),
-            task_kwargs={
-                **OmegaConf.to_container(cfg.task, resolve=True),
-                "study_dir": study_dir
-            }
+            task_entrypoint=task_entrypoint,
+            task_kwargs=task_kwargs
         ),
         nondeterministic=True
     )
 
-    study_dir = (Path(cfg.experiment.root_dir) / cfg.task.name).absolute()
-
     study = Study(
         agent_args=[agent],
         benchmark=benchmark,
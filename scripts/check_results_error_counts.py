@@ -26,16 +26,33 @@ This script searches in results/ for experiments that have failed.
 
 import os
 import dotenv
-import glob
-import json
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from tqdm.auto import tqdm
+from results_utils import find_summary_files, load_json
 
 
 FILE_DIR = os.path.dirname(os.path.abspath(__file__))
 dotenv.load_dotenv(os.path.join(FILE_DIR, "../.env"))
 
 
+def load_summary(file: str) -> dict:
+    # Experiment name from results/.../<exp>/<run>/summary_info.json
+    exp = os.path.basename(os.path.dirname(os.path.dirname(file)))
+
+    try:
+        summary = load_json(file)
+    except Exception as error:
+        print(f"Error loading {file}: {error}")
+        summary = {
+            "err_msg": str(error),
+            "stack_trace": str(error)
+        }
+
+    summary["exp"] = exp
+    return summary
+
+
 def main():
     results_dir = os.path.join(
         FILE_DIR,
@@ -43,51 +60,33 @@ def main():
         os.getenv("AGENTLAB_EXP_ROOT", os.path.join(FILE_DIR, "../results"))
     )
 
-    summary_files = glob.glob(
-        os.path.join(
-            results_dir,
-            "**",
-            "*",
-            "summary_info.json"
-        ),
-        recursive=True
-    )
+    summary_files = list(find_summary_files(results_dir))
 
-    summaries = []
-    for file in tqdm(summary_files):
-        with open(file) as json_file:
-            try:
-                summaries.append(json.load(json_file))
-            except Exception as error:
-                print(f"Error loading {file}: {error}")
-                summaries.append({
-                    "err_msg": str(error),
-                    "stack_trace": str(error),
-                    "exp": file.split("/")[-3]
-                })
-                continue
+    # Summaries are small, so loading them is dominated by file access latency
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        summaries = list(tqdm(
+            executor.map(load_summary, summary_files),
+            total=len(summary_files)
+        ))
 
     df = pd.DataFrame(summaries)
     df["file"] = summary_files
-    df["exp"] = df.file.apply(lambda x : x.split("/")[-3])
-
-    df_nem = set(df[df["err_msg"].isna()].exp.tolist())
-    df_nst = set(df[df["stack_trace"].isna()].exp.tolist())
 
-    df_em = df[~df["err_msg"].isna()]
-    df_st = df[~df["stack_trace"].isna()]
+    # Whether each experiment has at least one run without error message / stack trace
+    ok = df[["err_msg", "stack_trace"]].isna().groupby(df["exp"]).any()
 
-    df_em = df_em[~df_em.exp.isin(df_nem)].err_msg
-    df_st = df_st[~df_st.exp.isin(df_nst)].stack_trace
+    # Errors of the experiments that failed in every run
+    df_em = df.loc[~df["exp"].map(ok["err_msg"]), "err_msg"]
+    df_st = df.loc[~df["exp"].map(ok["stack_trace"]), "stack_trace"]
 
-    total_n = len(df.exp.unique())
+    total_n = len(ok)
     print("No error message: %d/%d" % (total_n - len(df_em), total_n))
     print("No stack trace: %d/%d" % (total_n - len(df_st), total_n))
 
     df_em.to_csv("err_msg.csv", index=False)
     df_st.to_csv("stack_trace.csv", index=False)
 
-    exps_remaining = set(df.exp.unique().tolist()) - (df_nem & df_nst)
+    exps_remaining = ok.index[~(ok["err_msg"] & ok["stack_trace"])]
     print("\nTotal exps remaining: %d\n" % len(exps_remaining))
     with open("exps_remaining.txt", "w") as outfile:
         outfile.write("\n".join(exps_remaining))
@@ -32,33 +32,42 @@ import argparse
 import ast
 import logging
 import glob
+import gzip
 import functools
 import multiprocessing
 import threading
-import json
-import yaml
 import dotenv
 import pandas
 import pickle
+import orjson
 import hashlib
+import math
+import pyarrow
 import browsergym
 import agentlab
 import re
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError, as_completed
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
 from tqdm.auto import tqdm
-from bs4 import BeautifulSoup
+from lxml import etree, html as lxml_html
 from page_utils import compress_html
+from results_utils import find_summary_files, load_json, load_yaml
 from typing import Optional, Any
 
 
+# Bump when the format of the collected results changes, so cached results are recomputed
+CACHE_VERSION = 2
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--results_root", type=str, required=True)
     parser.add_argument("--output_csv", type=str, default="aggregated_results.csv")
+    parser.add_argument("--output_parquet", type=str, default=None, help="Also save results as zstd-compressed Parquet")
     parser.add_argument("--num_workers", type=int, default=min(os.cpu_count(), 16))
     parser.add_argument("--use_threading", action="store_true")
     parser.add_argument("--cache_dir", type=str, default=".cache")
     parser.add_argument("--skip_cache", action="store_true")
+    parser.add_argument("--step_workers", type=int, default=1, help="Threads loading the steps of each experiment")
     parser.add_argument("--debug", action="store_true")
     parser.add_argument("--force_sequential", action="store_true", help="Force sequential processing for debugging")
     args = parser.parse_args()
@@ -74,75 +83,101 @@ def main():
     os.makedirs(cache_dir, exist_ok=True)
 
     # Find all experiment dirs
-    summary_files = glob.glob(os.path.join(results_dir, "**", "*", "summary_info.json"), recursive=True)
-
-    experiment_dirs = []
-    for file in tqdm(summary_files, desc="Filtering valid experiments"):
-        with open(file) as json_file:
-            try:
-                d = json.load(json_file)
-                err_msg = d.get("err_msg")
-                stack_trace = d.get("stack_trace")
-                if err_msg is None and stack_trace is None:
-                    exp_dir = os.path.dirname(os.path.dirname(file))
-                    experiment_dirs.append(exp_dir)
-            except Exception as error:
-                logging.warning("Error with %s: %s" % (file, error))
-
-    logging.info(f"Found {len(experiment_dirs)} experiment directories to process.")
-
-    if not experiment_dirs:
+    summary_files = list(find_summary_files(results_dir))
+
+    # Keep the parsed summaries, so they are not read again when processing
+    experiments = []
+    with ThreadPoolExecutor(max_workers=min(32, os.cpu_count() * 4)) as executor:
+        for file, d in tqdm(
+            zip(summary_files, executor.map(load_summary, summary_files)),
+            desc="Filtering valid experiments",
+            total=len(summary_files)
+        ):
+            if d is not None and d.get("err_msg") is None and d.get("stack_trace") is None:
+                exp_dir = os.path.dirname(os.path.dirname(file))
+                experiments.append((exp_dir, d))
+
+    logging.info(f"Found {len(experiments)} experiment directories to process.")
+
+    if not experiments:
         logging.info("No experiment directories found.")
         return
 
     # Process experiments
     if args.force_sequential:
         logging.info("Using sequential processing for debugging")
-        all_normalized_dfs = process_sequentially(experiment_dirs, cache_dir, args.skip_cache)
+        all_results = process_sequentially(experiments, cache_dir, args.skip_cache, args.step_workers)
     elif args.use_threading:
         logging.info(f"Using threading with {args.num_workers} workers")
-        all_normalized_dfs = process_with_threading(experiment_dirs, cache_dir, args.num_workers, args.skip_cache)
+        all_results = process_with_threading(experiments, cache_dir, args.num_workers, args.skip_cache, args.step_workers)
     else:
         logging.info(f"Using multiprocessing with {args.num_workers} workers")
-        all_normalized_dfs = process_with_multiprocessing(experiment_dirs, cache_dir, args.num_workers, args.skip_cache)
+        all_results = process_with_multiprocessing(experiments, cache_dir, args.num_workers, args.skip_cache, args.step_workers)
+
+    logging.info("Normalizing results")
+    df = pandas.json_normalize(all_results)
 
-    logging.info("Concatenating dataframes")
-    df = pandas.concat(all_normalized_dfs, ignore_index=True)
+    # Steps are kept as one JSON column, instead of a set of columns per step
+    df["steps"] = df["steps"].map(lambda steps: orjson.dumps(steps).decode("utf-8"))
 
     logging.info("Writing output")
     output_csv_path = os.path.abspath(args.output_csv)
     df.to_csv(output_csv_path, index=False)
     logging.info(f"Saved aggregated results to {output_csv_path}")
 
+    if args.output_parquet:
+        output_parquet_path = os.path.abspath(args.output_parquet)
+        save_parquet(df, output_parquet_path)
+        logging.info(f"Saved aggregated results to {output_parquet_path}")
+
+
+def save_parquet(df: pandas.DataFrame, path: str):
+    """Saves results as Parquet, storing columns Arrow can't type (e.g. mixed lists) as strings."""
+    df = df.copy()
+    for column in df.columns[df.dtypes == object]:
+        try:
+            pyarrow.array(df[column], from_pandas=True)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            df[column] = df[column].map(lambda value: None if is_missing(value) else str(value))
+
+    df.to_parquet(path, index=False, compression="zstd")
+
+
+def is_missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
 
 def process_with_threading(
-    experiment_dirs: list[str],
+    experiments: list[tuple[str, dict]],
     cache_dir: str,
     num_workers: int,
     skip_cache: bool,
+    step_workers: int = 1,
     timeout: float = 10
-) -> list[pandas.DataFrame]:
-    all_normalized_dfs = []
+) -> list[dict]:
+    all_results = []
 
     # Use a thread-safe lock (for the cache operations)
     cache_lock = threading.Lock()
 
-    def process_with_lock(exp_dir: str) -> pandas.DataFrame:
-        return process_experiment_dir_to_df_cached_threadsafe(
+    def process_with_lock(exp_dir: str, summary_info: dict) -> Optional[dict]:
+        return process_experiment_dir_cached_threadsafe(
             exp_dir,
+            summary_info,
             cache_dir,
             skip_cache,
-            cache_lock
+            cache_lock,
+            step_workers
         )
 
     completed_count = 0
-    total_count = len(experiment_dirs)
+    total_count = len(experiments)
 
     with ThreadPoolExecutor(max_workers=num_workers) as executor:
         # Submit all tasks upfront
         future_to_dir = {
-            executor.submit(process_with_lock, exp_dir): exp_dir
-            for exp_dir in experiment_dirs
+            executor.submit(process_with_lock, exp_dir, summary_info): exp_dir
+            for exp_dir, summary_info in experiments
         }
 
         # Use as_completed with explicit timeout handling
@@ -152,9 +187,9 @@ def process_with_threading(
 
             try:
                 # Individual task timeout
-                df_part = future.result(timeout=timeout)
-                if not df_part.empty:
-                    all_normalized_dfs.append(df_part)
+                result = future.result(timeout=timeout)
+                if result is not None:
+                    all_results.append(result)
 
                 # Manual progress update since tqdm can hang
                 if completed_count % 10 == 0 or completed_count == total_count:
@@ -165,76 +200,66 @@ def process_with_threading(
             except Exception as error:
                 logging.error(f"Error processing {exp_dir}: {error}")
 
-    logging.info(f"Threading completed: {len(all_normalized_dfs)}/{total_count} successful")
-    return all_normalized_dfs
+    logging.info(f"Threading completed: {len(all_results)}/{total_count} successful")
+    return all_results
 
 
 def process_with_multiprocessing(
-    experiment_dirs: list,
+    experiments: list,
     cache_dir: str,
     num_workers: int,
     skip_cache: bool,
-    timeout: float = 10
-) -> list[pandas.DataFrame]:
-    all_normalized_dfs = []
+    step_workers: int = 1
+) -> list[dict]:
+    all_results = []
 
     # Worker function
     process_func = functools.partial(
-        process_experiment_dir_to_df_cached,
+        process_experiment,
         cache_dir=cache_dir,
-        skip_cache=skip_cache
+        skip_cache=skip_cache,
+        step_workers=step_workers
     )
 
-    total_count = len(experiment_dirs)
-    pbar = tqdm(total=total_count, desc="Processing experiments")
+    total_count = len(experiments)
 
-    # Force spawn to avoid pickle issues
-    ctx = multiprocessing.get_context("spawn")
+    # Fork on Linux, so workers share the already imported modules instead of importing them again
+    ctx = multiprocessing.get_context("fork" if sys.platform.startswith("linux") else "spawn")
 
-    with ProcessPoolExecutor(max_workers=num_workers, mp_context=ctx) as executor:
-        # Submit all tasks upfront
-        future_to_dir = {
-            executor.submit(process_func, exp_dir): exp_dir
-            for exp_dir in experiment_dirs
-        }
+    # Send experiments in chunks to reduce the communication per task
+    chunksize = max(1, total_count // (num_workers * 8))
 
-        # Process results with per-task timeout
-        for future in as_completed(future_to_dir.keys()):
-            exp_dir = future_to_dir[future]
-            try:
-                # Apply timeout per individual task
-                df_part = future.result(timeout=timeout)
-                if not df_part.empty:
-                    all_normalized_dfs.append(df_part)
-            except TimeoutError:
-                logging.error(f"Task for {exp_dir} timed out after {timeout} seconds")
-            except Exception as error:
-                logging.error(f"Error processing {exp_dir}: {error}")
+    with ctx.Pool(processes=num_workers) as pool:
+        for result in tqdm(
+            pool.imap_unordered(process_func, experiments, chunksize=chunksize),
+            desc="Processing experiments",
+            total=total_count
+        ):
+            if result is not None:
+                all_results.append(result)
 
-            pbar.update(1)
-
-    pbar.close()
-    logging.info(f"Multiprocessing completed: {len(all_normalized_dfs)}/{total_count} successful")
-    return all_normalized_dfs
+    logging.info(f"Multiprocessing completed: {len(all_results)}/{total_count} successful")
+    return all_results
 
 
 def process_sequentially(
-    experiment_dirs: list,
+    experiments: list,
     cache_dir: str,
-    skip_cache: bool
-) -> list[pandas.DataFrame]:
-    all_normalized_dfs = []
+    skip_cache: bool,
+    step_workers: int = 1
+) -> list[dict]:
+    all_results = []
 
-    for i, exp_dir in tqdm(enumerate(experiment_dirs), desc="Processing experiments", total=len(experiment_dirs)):
+    for exp_dir, summary_info in tqdm(experiments, desc="Processing experiments", total=len(experiments)):
         try:
-            df_part = process_experiment_dir_to_df_cached(exp_dir, cache_dir, skip_cache)
-            if not df_part.empty:
-                all_normalized_dfs.append(df_part)
+            result = process_experiment_dir_cached(exp_dir, summary_info, cache_dir, skip_cache, step_workers)
+            if result is not None:
+                all_results.append(result)
 
         except Exception as error:
             logging.error(f"Sequential error processing {exp_dir}: {error}")
 
-    return all_normalized_dfs
+    return all_results
 
 
 def get_experiment_hash(experiment_dir_path: str) -> str:
@@ -242,46 +267,64 @@ def get_experiment_hash(experiment_dir_path: str) -> str:
     key_files = ["config.yaml", "nudge_metadata.yaml", "study.pkl.gz"]
     file_info = []
 
+    # Key by file sizes rather than mtimes, which change when results are copied or touched
     for key_file in key_files:
         file_path = os.path.join(experiment_dir_path, key_file)
         if os.path.exists(file_path):
-            file_info.append(f"{key_file}:{os.path.getmtime(file_path)}")
-
-    step_files = glob.glob(os.path.join(experiment_dir_path, "*/step_*.pkl.gz"))
-    if step_files:
-        latest_step_mtime = max(os.path.getmtime(f) for f in step_files)
-        file_info.append(f"steps:{len(step_files)}:{latest_step_mtime}")
-
-    hash_string = f"{exp_name}:{'|'.join(file_info)}"
+            file_info.append(f"{key_file}:{os.path.getsize(file_path)}")
+
+    step_files = sorted(glob.glob(os.path.join(experiment_dir_path, "*/step_*.pkl.gz")))
+    for step_file in step_files:
+        file_info.append(f"{os.path.relpath(step_file, experiment_dir_path)}:{os.path.getsize(step_file)}")
+
+    # A re-run can write files of the same sizes, so also hash the small files it always rewrites
+    content_files = [os.path.join(experiment_dir_path, "study.pkl.gz")]
+    content_files += sorted(glob.glob(os.path.join(experiment_dir_path, "*/summary_info.json")))
+    for content_file in content_files:
+        if os.path.exists(content_file):
+            with open(content_file, "rb") as f:
+                content_hash = hashlib.md5(f.read()).hexdigest()
+            file_info.append(f"{os.path.relpath(content_file, experiment_dir_path)}:{content_hash}")
+
+    hash_string = f"{CACHE_VERSION}:{exp_name}:{'|'.join(file_info)}"
     return hashlib.md5(hash_string.encode()).hexdigest()
 
 
-def load_cached_result(experiment_dir_path: str, cache_dir: str) -> Optional[pandas.DataFrame]:
+def load_cached_result(experiment_dir_path: str, cache_dir: str) -> Optional[dict]:
     exp_hash = get_experiment_hash(experiment_dir_path)
     cache_file = os.path.join(cache_dir, f"{exp_hash}.pkl")
 
     if os.path.exists(cache_file):
         try:
             with open(cache_file, "rb") as f:
-                return pickle.load(f)
+                result = pickle.load(f)
+            # Older caches stored normalized DataFrames, recompute those
+            if isinstance(result, dict):
+                return result
         except Exception as error:
             logging.warning(f"Failed to load cache for {experiment_dir_path}: {error}")
     return None
 
 
-def save_cached_result(experiment_dir_path: str, cache_dir: str, df: pandas.DataFrame):
+def save_cached_result(experiment_dir_path: str, cache_dir: str, result: dict):
     """Save result to cache."""
     exp_hash = get_experiment_hash(experiment_dir_path)
     cache_file = os.path.join(cache_dir, f"{exp_hash}.pkl")
 
     try:
         with open(cache_file, "wb") as f:
-            pickle.dump(df, f)
+            pickle.dump(result, f)
     except Exception as error:
         logging.warning(f"Failed to save cache for {experiment_dir_path}: {error}")
 
 
-def process_experiment_dir_to_df_cached(experiment_dir_path: str, cache_dir: str, skip_cache: bool = False) -> pandas.DataFrame:
+def process_experiment_dir_cached(
+    experiment_dir_path: str,
+    summary_info: Optional[dict],
+    cache_dir: str,
+    skip_cache: bool = False,
+    step_workers: int = 1
+) -> Optional[dict]:
     """Process experiment directory with caching support."""
     if not skip_cache:
         cached_result = load_cached_result(experiment_dir_path, cache_dir)
@@ -289,23 +332,34 @@ def process_experiment_dir_to_df_cached(experiment_dir_path: str, cache_dir: str
             return cached_result
 
     try:
-        experiment_data_dict = collect_results_for_experiment(experiment_dir_path)
-        df = pandas.json_normalize(experiment_data_dict)
+        experiment_data_dict = collect_results_for_experiment(experiment_dir_path, summary_info, step_workers)
 
         if not skip_cache:
-            save_cached_result(experiment_dir_path, cache_dir, df)
+            save_cached_result(experiment_dir_path, cache_dir, experiment_data_dict)
 
-        return df
+        return experiment_data_dict
     except Exception as error:
         logging.error(f"Error processing {experiment_dir_path}: {error}")
-        return pandas.DataFrame()
+        return None
 
-def process_experiment_dir_to_df_cached_threadsafe(
+def process_experiment(experiment: tuple[str, dict], **kwargs) -> Optional[dict]:
+    """Processes an (exp_dir, summary_info) pair, logging errors so a worker never raises."""
+    exp_dir, summary_info = experiment
+    try:
+        return process_experiment_dir_cached(exp_dir, summary_info, **kwargs)
+    except Exception as error:
+        logging.error(f"Error processing {exp_dir}: {error}")
+        return None
+
+
+def process_experiment_dir_cached_threadsafe(
     experiment_dir_path: str,
+    summary_info: Optional[dict],
     cache_dir: str,
     skip_cache: bool,
-    cache_lock: threading.Lock
-) -> pandas.DataFrame:
+    cache_lock: threading.Lock,
+    step_workers: int = 1
+) -> dict:
     """Thread-safe cached processing function."""
 
     if not skip_cache:
@@ -314,41 +368,44 @@ def process_experiment_dir_to_df_cached_threadsafe(
             if cached_result is not None:
                 return cached_result
 
-    experiment_data_dict = collect_results_for_experiment(experiment_dir_path)
-    df = pandas.json_normalize(experiment_data_dict)
+    experiment_data_dict = collect_results_for_experiment(experiment_dir_path, summary_info, step_workers)
 
     if not skip_cache:
         with cache_lock:
-            save_cached_result(experiment_dir_path, cache_dir, df)
+            save_cached_result(experiment_dir_path, cache_dir, experiment_data_dict)
 
-    return df
+    return experiment_data_dict
 
 
-def collect_results_for_experiment(results_dir: str) -> dict:
+def collect_results_for_experiment(
+    results_dir: str,
+    summary_info: Optional[dict] = None,
+    step_workers: int = 1
+) -> dict:
     step_pickle_files = sorted(glob.glob(os.path.join(results_dir, "*/step_*.pkl.gz")))
-    steps_info = [get_info_for_step(pandas.read_pickle(step_file)) for step_file in step_pickle_files]
+    if step_workers > 1:
+        # Decompression and lxml parsing release the GIL, so steps can overlap
+        with ThreadPoolExecutor(max_workers=step_workers) as executor:
+            steps_info = list(executor.map(load_step_info, step_pickle_files))
+    else:
+        steps_info = [load_step_info(step_file) for step_file in step_pickle_files]
 
     study_path = os.path.join(results_dir, "study.pkl.gz")
-    study_object = pandas.read_pickle(study_path)
+    study_object = load_pickle(study_path)
     study_info = get_info_from_study(study_object)
 
-    cfg_file = os.path.join(results_dir, "config.yaml")
-    with open(cfg_file) as yaml_file:
-        cfg = yaml.safe_load(yaml_file)
-
-    nudge_file = os.path.join(results_dir, "nudge_metadata.yaml")
-    with open(nudge_file) as yaml_file:
-        nudge_metadata_loaded = yaml.safe_load(yaml_file)
+    cfg = load_yaml(os.path.join(results_dir, "config.yaml"))
+    nudge_metadata_loaded = load_yaml(os.path.join(results_dir, "nudge_metadata.yaml"))
 
     nudge_metadata = nudge_metadata_loaded[0] if isinstance(nudge_metadata_loaded, list) and len(nudge_metadata_loaded) > 0 else {}
     if not isinstance(nudge_metadata, dict) and isinstance(nudge_metadata_loaded, dict):
         nudge_metadata = nudge_metadata_loaded
 
-
-    summary_file_paths = glob.glob(os.path.join(results_dir, "*/summary_info.json"))
-    summary_file_to_load = summary_file_paths[0]
-    with open(summary_file_to_load) as json_file:
-        summary_info = json.load(json_file)
+    # The summary may already be loaded (e.g. while filtering experiments)
+    if summary_info is None:
+        summary_file_paths = glob.glob(os.path.join(results_dir, "*/summary_info.json"))
+        summary_file_to_load = summary_file_paths[0]
+        summary_info = load_json(summary_file_to_load)
 
     experiment_id = os.path.basename(results_dir)
 
@@ -360,27 +417,76 @@ def collect_results_for_experiment(results_dir: str) -> dict:
         "cfg": cfg,
         "nudge": nudge_metadata,
         "summary": summary_info,
-        **{
-            "step_%d" % i: step_info for i, step_info in enumerate(steps_info)
-        },
+        "steps": steps_info,
         "final_step": steps_info[-1] if len(steps_info) > 0 else None # Renamed
     }
     return data_dict
 
 
+def load_summary(path: str) -> Optional[dict]:
+    try:
+        return load_json(path)
+    except Exception as error:
+        logging.warning("Error with %s: %s" % (path, error))
+        return None
+
+
+# Compiled once; the bid is passed as a variable, so it needs no quoting
+_BID_XPATH = etree.XPath("//*[@bid=$bid]")
+
+
+@functools.lru_cache(maxsize=16)
+def parse_html(html: str) -> Any:
+    # Steps often share the same page (e.g. after an action without effect), so keep recent trees
+    return lxml_html.fromstring(html)
+
+
+def load_pickle(path: str) -> Any:
+    """Loads a gzipped pickle (steps and studies are not DataFrames, so skip pandas)."""
+    with gzip.open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def load_step_info(path: str) -> dict:
+    return get_info_for_step(load_pickle(path))
+
+
+# Most actions are calls with plain literal arguments, e.g. click('a51') or scroll(0, 300)
+_SIMPLE_ARG = r"""(?:'[^'\\\n]*'|"[^"\\\n]*"|\d+(?:\.\d+)?|True|False|None)"""
+_SIMPLE_ACTION_RE = re.compile(
+    r"^([A-Za-z_]\w*)\(\s*((?:%s\s*,\s*)*%s)?\s*\)$" % (_SIMPLE_ARG, _SIMPLE_ARG)
+)
+
+
 def parse_action(call_string: Optional[str]) -> Optional[dict]:
     if call_string is None:
         return None
 
+    function_name, arguments = _parse_action_cached(call_string)
+    return {
+        "name": function_name,
+        "args": list(arguments) if arguments is not None else None
+    }
+
+
+@functools.lru_cache(maxsize=100_000)
+def _parse_action_cached(call_string: str) -> tuple[str, Optional[tuple]]:
+    # Fast path, all arguments are constants so literal_eval gives the same result as the AST below
+    match = _SIMPLE_ACTION_RE.match(call_string)
+    if match:
+        try:
+            args_string = match.group(2)
+            arguments = ast.literal_eval("(%s,)" % args_string) if args_string else ()
+            return match.group(1), arguments
+        except (ValueError, SyntaxError):
+            pass
+
     parsed_ast = ast.parse(call_string)
     try:
         call_node = parsed_ast.body[0].value
     except:
         logging.error("Failed to parse action call string: %s" % call_string)
-        return {
-            "name": call_string,
-            "args": None
-        }
+        return call_string, None
 
     function_name = call_node.func.id
 
@@ -389,12 +495,11 @@ def parse_action(call_string: Optional[str]) -> Optional[dict]:
         if isinstance(arg_node, ast.Constant):
             arguments.append(arg_node.value)
 
-    return {"name": function_name, "args": arguments}
+    return function_name, tuple(arguments)
 
 
 def get_info_for_step(step: Any) -> dict:
     pruned_html = step.obs["pruned_html"]
-    soup = BeautifulSoup(pruned_html, "html.parser")
     action = None
     try:
         action = parse_action(step.obs.get("last_action"))
@@ -405,7 +510,10 @@ def get_info_for_step(step: Any) -> dict:
     elem = None
     if action is not None and action.get("args"):
         try:
-            elem = soup.select_one("[bid=\"%s\"]" % action["args"][0])
+            # Only parse the page when there is an element to look up
+            tree = parse_html(pruned_html)
+            matches = _BID_XPATH(tree, bid=str(action["args"][0]))
+            elem = matches[0] if matches else None
         except:
             print("Error selecting element with bid: %s" % action["args"][0])
             elem = None
@@ -413,9 +521,9 @@ def get_info_for_step(step: Any) -> dict:
     elem_info = None
     if elem is not None:
         elem_info = {
-            "name": elem.name,
-            "attrs": elem.attrs,
-            "text": elem.text
+            "name": elem.tag,
+            "attrs": dict(elem.attrib),
+            "text": elem.text_content()
         }
 
     url = step.obs["url"]
@@ -0,0 +1,88 @@
+# Copyright (c) 2025
+# Manuel Cherep <mcherep@mit.edu>
+# Nikhil Singh <nikhil.u.singh@dartmouth.edu>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This script lists the experiments that still need to run when continuing a previous run.
+
+It applies the same check as experiment.continue_from in run.py, but before launching Hydra, so
+completed experiments don't pay for config composition and setup. The output can be passed
+directly to a multirun, e.g.
+
+EXPS=$(python scripts/filter_done_tasks.py --continue_from results/run-... --exp_dir conf/experiment) && \
+    python run.py --multirun "+experiment=${EXPS}"
+
+If every experiment is already done, it exits with an error instead of printing an empty list
+(which would make an invalid "+experiment=" override), so the launch above is skipped.
+"""
+
+import os
+import sys
+import logging
+import argparse
+from results_utils import find_summary_files, load_json
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--continue_from", type=str, required=True, help="Results directory of the previous run.")
+    parser.add_argument("--exp_dir", type=str, required=True, help="Directory with the experiment configs (e.g. conf/experiment).")
+    parser.add_argument("--output_file", type=str, help="Optional file to write the experiments to, instead of stdout.")
+    args = parser.parse_args()
+
+    exp_names = sorted(
+        (os.path.splitext(fname)[0] for fname in os.listdir(args.exp_dir) if fname.endswith(".yaml")),
+        key=lambda name: (len(name), name)
+    )
+    remaining = [name for name in exp_names if not is_done(os.path.join(args.continue_from, name))]
+    logging.info("%d/%d experiments remaining", len(remaining), len(exp_names))
+    if not remaining:
+        logging.error("All experiments in %s are done, nothing to run", args.exp_dir)
+        sys.exit(1)
+
+    output = ",".join(remaining)
+    if args.output_file:
+        with open(args.output_file, "w") as outfile:
+            outfile.write(output)
+    else:
+        sys.stdout.write(output + "\n")
+
+
+def is_done(study_dir: str) -> bool:
+    """Checks if the experiment in study_dir ran *correctly* (see run.py)."""
+    if not os.path.exists(study_dir):
+        return False
+
+    summary_files = list(find_summary_files(study_dir))
+    if len(summary_files) != 1:
+        logging.warning("Expected exactly one summary_info.json in %s, found %d", study_dir, len(summary_files))
+        return False
+
+    summary_info = load_json(summary_files[0])
+
+    return (summary_info.get("err_msg") is None) and (summary_info.get("stack_trace") is None)
+
+
+if __name__ == "__main__":
+    main()
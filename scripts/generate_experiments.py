@@ -25,19 +25,40 @@ This script generates experiment configuration files based on provided data file
 """
 
 import os
+import ast
 import argparse
+import functools
 import string
-import yaml
+import re
+import json
+import math
+import numbers
 import pandas as pd
 import numpy as np
 import random
 import dspy
 import dotenv
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Selections and merges below share data until they are modified, instead of copying
+pd.set_option("mode.copy_on_write", True)
 
 SEED = 42
 EXP_DIR = "conf/experiment"
 MODEL = "gpt-4.1-mini"
+LLM_WORKERS = 32
+MATCHING_PRICE_AND_REVIEW_COUNT = "Matching Price and Review Count"
+MAX_TOKENS = 1000 # Reasoning plus a short value, well below the LM default of 4000
+SIMPLE_KEY = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# Characters YAML can't hold raw in a double-quoted scalar: the non-printable ones, plus line
+# breaks and the BOM (escaped by yaml.dump too). JSON already escapes the C0 controls.
+YAML_ESCAPED = re.compile("[^\x09\x0A\x0D\x20-\x7E\xA0-\u2027\u202A-\uD7FF\uE000-\uFEFE\uFF00-\uFFFD\U00010000-\U0010FFFF]")
+CONFIG_COLUMNS = [
+    "Nudge Index", "Start URLs", "Nudge", "Module", "Name", "Intervention", "Intent", "Intent Dictionary",
+    "Intent Template ID", "Average Price", "Average Review Count", "coverage_type", "user_preference"
+]
+CATEGORICAL_COLUMNS = ["Intent", "Nudge", "Starting Point", "Module", "Name", "Intervention", "Variables", "category"]
 
 class VariableSubstitution(dspy.Signature):
     """Given an intervention with a variable placeholder, a variable name, and a product category, generate an appropriate replacement value for that variable. The intervention must be coherent when replacing the variable with a value. The category name must be simplified to ensure the intervention sounds as natural as possible. Pay attention to the category context, some categories are ambigious."""
@@ -69,8 +90,8 @@ def generate_experiments(
         category_context = f.read()
 
     # Load CSV files
-    df_intents = pd.read_csv("tasks/intents.csv")
-    df_interventions = pd.read_csv("tasks/interventions.csv")
+    df_intents = read_csv("tasks/intents.csv")
+    df_interventions = read_csv("tasks/interventions.csv")
 
     # Include the intent template ID
     df_intents = df_intents.reset_index().rename(columns={"index": "Intent Template ID"})
@@ -93,7 +114,7 @@ def generate_experiments(
 
     # Combine intents and interventions
     if no_nudges:
-        df_tasks = df_intents.copy()
+        df_tasks = df_intents
     else:
         df_tasks = df_intents.merge(
             df_interventions,
@@ -102,7 +123,7 @@ def generate_experiments(
             how="left"
         )
 
-    df_products = pd.read_csv(products)
+    df_products = read_csv(products)
 
     # Default to group_size=2 if column doesn't exist (backward compatibility)
     if 'group_size' not in df_products.columns:
@@ -112,33 +133,31 @@ def generate_experiments(
     print(f"Loaded {len(df_products)} product groups")
     print(f"Loaded {len(df_tasks[df_tasks['Starting Point'] == 'Product'])} interventions")
 
-    # Create Start URLs dynamically based on group_size
-    def extract_product_urls(row):
-        n = int(row['group_size'])
-        urls = [row[f'product{i+1}_url'] for i in range(n)]
-        return tuple(random.sample(urls, len(urls)))  # Shuffle
+    # Columns past each group's size are masked out, so all groups are handled at once
+    group_sizes = df_products["group_size"].astype(int).to_numpy()
+    in_group = np.arange(group_sizes.max())[None, :] < group_sizes[:, None]
 
-    df_products["Start URLs"] = df_products.apply(extract_product_urls, axis=1)
+    def group_columns(field):
+        return df_products[[f'product{i+1}_{field}' for i in range(in_group.shape[1])]].to_numpy()
 
-    # Calculate average price and review count dynamically
-    def calculate_average_price(row):
-        n = int(row['group_size'])
-        prices = [row[f'product{i+1}_price'] for i in range(n)]
-        return sum(prices) / n
+    # Create Start URLs dynamically based on group_size
+    df_products["Start URLs"] = [
+        tuple(random.sample(list(urls[:n]), n))  # Shuffle
+        for urls, n in zip(group_columns("url"), group_sizes)
+    ]
 
-    def calculate_average_reviews(row):
-        n = int(row['group_size'])
-        reviews = [row[f'product{i+1}_reviews'] for i in range(n)]
-        return sum(reviews) // n
+    # Calculate average price and review count dynamically
+    def sum_over_group(field):
+        return np.where(in_group, group_columns(field), 0).sum(axis=1)
 
-    df_products["Average Price"] = df_products.apply(calculate_average_price, axis=1)
-    df_products["Average Review Count"] = df_products.apply(calculate_average_reviews, axis=1)
+    df_products["Average Price"] = sum_over_group("price") / group_sizes
+    df_products["Average Review Count"] = sum_over_group("reviews") // group_sizes
 
     # Subselect by type
-    df_tasks_products = df_tasks[df_tasks["Starting Point"] == "Product"].copy()
+    df_tasks_products = df_tasks[df_tasks["Starting Point"] == "Product"]
 
     # Combine with start urls in other dataframe
-    df_tasks_products_all = df_tasks_products.merge(df_products, how="cross")
+    df_tasks_products_all = cross_join(to_categorical(df_tasks_products), to_categorical(df_products))
 
     # Empty intent dictionary
     df_tasks_products_all["Intent Dictionary"] = "{}"
@@ -155,51 +174,25 @@ def generate_experiments(
             ~df_tasks_products_all["Variables"].isna()
         ][["category", "Intervention", "Variables"]].drop_duplicates()
 
-        substitution_map = {}
-        for _, row in tqdm(unique_intervention_category.iterrows(),
-                           total=len(unique_intervention_category)):
-            # Generate substituted intervention
-            new_intervention = string.Template(row["Intervention"]).substitute(
-                {
-                    row["Variables"]: llm_call(
-                        intervention=row["Intervention"],
-                        variable=row["Variables"],
-                        category=row["category"],
-                        category_context=category_context
-                    ).value
-                }
-            )
-
-            # Store mapping from original to substituted intervention
-            substitution_map[(row["category"], row["Intervention"])] = new_intervention
+        substitution_map = get_substitution_map(unique_intervention_category, llm_call, category_context)
 
         # Apply substitutions to original dataframe
-        df_tasks_products_all["Intervention"] = df_tasks_products_all.apply(
-            lambda row: substitution_map.get(
-                (row["category"], row["Intervention"]),
-                row["Intervention"]
-            ),
-            axis=1
-        )
+        df_tasks_products_all = apply_substitutions(df_tasks_products_all, substitution_map)
 
         # We need to duplicate the product tasks to nudge different tabs and none at all
         # Create duplicated rows with Nudge Index 0..N (number of elements in Start URLs - 1)
-        duplicates = df_tasks_products_all.loc[
-            df_tasks_products_all.index.repeat(
-                df_tasks_products_all["Start URLs"].str.len()
-            )
-        ].copy()
-        duplicates["Nudge Index"] = df_tasks_products_all.groupby(
-            df_tasks_products_all.index
-        ).apply(
-            lambda x: list(range(len(x.iloc[0]["Start URLs"])))
-        ).explode().astype(int).values
-
-        # Combine original + duplicated
-        df_tasks_products_all = pd.concat(
-            [df_tasks_products_all, duplicates],
-            ignore_index=True
-        ).reset_index(drop=True)
+        lens = df_tasks_products_all["Start URLs"].str.len().to_numpy()
+        positions = np.arange(len(lens))
+
+        # Take original + duplicated rows in a single copy (originals first, as before)
+        df_tasks_products_all = df_tasks_products_all.iloc[
+            np.concatenate([positions, np.repeat(positions, lens)])
+        ].reset_index(drop=True)
+        # Position of each copy within its task, i.e. 0..len - 1 restarting at every task
+        df_tasks_products_all["Nudge Index"] = np.concatenate([
+            np.full(len(lens), np.nan),
+            np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens)
+        ])
 
     print(f"Generating {len(df_tasks_products_all)} product configs")
     print("=" * 50 + "\n")
@@ -209,94 +202,255 @@ def generate_experiments(
         save_configs(df_tasks_products_all, exp_dir, match_price, match_review_count)
 
 
-def save_configs(df, exp_dir, match_price=False, match_review_count=False):
-    for idx, row in tqdm(df.iterrows(), total=len(df)):
-        if np.isnan(row["Nudge Index"]):
-            choices = []
-        else:
-            url = row["Start URLs"][int(row["Nudge Index"])]
-            choices = [
+def read_csv(path):
+    # Arrow-backed columns keep strings in contiguous buffers instead of Python objects
+    return pd.read_csv(path, engine="pyarrow", dtype_backend="pyarrow")
+
+def cross_join(left, right):
+    # Same rows and order as left.merge(right, how="cross"), without the hash join on a dummy key
+    left_positions = np.repeat(np.arange(len(left)), len(right))
+    right_positions = np.tile(np.arange(len(right)), len(left))
+    return pd.concat([
+        left.iloc[left_positions].reset_index(drop=True),
+        right.iloc[right_positions].reset_index(drop=True)
+    ], axis=1)
+
+def to_categorical(df, columns=CATEGORICAL_COLUMNS):
+    # The cross merge repeats these strings on every row, so store them as category codes
+    return df.assign(**{
+        column: df[column].astype("category") for column in columns if column in df.columns
+    })
+
+def get_substitution_map(unique_intervention_category, llm_call, category_context):
+    def substitute_variables(row):
+        # Generate substituted intervention
+        return string.Template(row["Intervention"]).substitute(
+            {
+                row["Variables"]: llm_call(
+                    intervention=row["Intervention"],
+                    variable=row["Variables"],
+                    category=row["category"],
+                    category_context=category_context
+                ).value
+            }
+        )
+
+    # LLM calls mostly wait on the network, so run them concurrently
+    rows = unique_intervention_category.to_dict("records")
+    with ThreadPoolExecutor(max_workers=LLM_WORKERS) as executor:
+        new_interventions = list(tqdm(executor.map(substitute_variables, rows), total=len(rows)))
+
+    # Mapping from original to substituted intervention
+    return {
+        (row["category"], row["Intervention"]): new_intervention
+        for row, new_intervention in zip(rows, new_interventions)
+    }
+
+def apply_substitutions(df, substitution_map):
+    # Join the (few) substitutions instead of looking them up row by row
+    substitutions = pd.DataFrame(
+        [(category, intervention, new) for (category, intervention), new in substitution_map.items()],
+        columns=["category", "Intervention", "New Intervention"]
+    )
+    df = df.merge(substitutions, on=["category", "Intervention"], how="left")
+    df["Intervention"] = df.pop("New Intervention").fillna(df["Intervention"])
+    return df
+
+# Most rows share the same intents, so parse and substitute each one only once
+@functools.lru_cache(maxsize=None)
+def parse_intent_dictionary(intent_dictionary):
+    return ast.literal_eval(intent_dictionary)
+
+@functools.lru_cache(maxsize=None)
+def substitute_intent(intent, intent_dictionary):
+    return string.Template(intent).substitute(parse_intent_dictionary(intent_dictionary))
+
+def save_configs(df, exp_dir, match_price=False, match_review_count=False, num_workers=None):
+    os.makedirs(exp_dir, exist_ok=True)
+
+    # Plain dicts with only the columns used by the configs, read column by column
+    columns = [column for column in CONFIG_COLUMNS if column in df.columns]
+    tasks = [
+        (idx, dict(zip(columns, values)))
+        for idx, *values in zip(df.index, *(df[column].tolist() for column in columns))
+    ]
+    write_config = functools.partial(
+        save_config,
+        exp_dir=exp_dir,
+        match_price=match_price,
+        match_review_count=match_review_count
+    )
+
+    # Configs are independent files, so they can be written in parallel
+    num_workers = num_workers or os.cpu_count()
+    chunksize = max(1, len(tasks) // (num_workers * 8))
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for _ in tqdm(executor.map(write_config, tasks, chunksize=chunksize), total=len(tasks)):
+            pass
+
+def save_config(task, exp_dir, match_price=False, match_review_count=False):
+    idx, row = task
+    if np.isnan(row["Nudge Index"]):
+        choices = []
+    else:
+        url = row["Start URLs"][int(row["Nudge Index"])]
+        choices = [
+            {
+                "url": url,
+                "nudge": row["Nudge"],
+                "functions": [
+                    {
+                        "module": row["Module"],
+                        "name": row["Name"],
+                        "args": {"value": row["Intervention"]}
+                    }
+                ]
+            }
+        ]
+
+    # Matching interventions are always created, for every start URL
+    matching = []
+    if match_price:
+        matching.append(("Matching Price", "price", row["Average Price"]))
+    if match_review_count:
+        matching.append(("Matching Review Count", "review_count", row["Average Review Count"]))
+
+    if len(matching) > 1:
+        # Apply them together, so each page is only parsed once for all of them
+        for url in row["Start URLs"]:
+            choices.append(
                 {
                     "url": url,
-                    "nudge": row["Nudge"],
+                    "nudge": MATCHING_PRICE_AND_REVIEW_COUNT,
                     "functions": [
                         {
                             "module": row["Module"],
-                            "name": row["Name"],
-                            "args": {"value": row["Intervention"]}
+                            "name": "apply",
+                            "args": {name: value for _, name, value in matching}
                         }
                     ]
                 }
-            ]
-
-        # If matching price, then always create the intervention
-        if match_price:
-            for url in row["Start URLs"]:
-                choices.append(
-                    {
-                        "url": url,
-                        "nudge": "Matching Price",
-                        "functions": [
-                            {
-                                "module": row["Module"],
-                                "name": "price",
-                                "args": {"value": row["Average Price"]}
-                            }
-                        ]
-                    }
-                )
-
-        # If matching review count, then always create the intervention
-        if match_review_count:
+            )
+    else:
+        for nudge, name, value in matching:
             for url in row["Start URLs"]:
                 choices.append(
                     {
                         "url": url,
-                        "nudge": "Matching Review Count",
+                        "nudge": nudge,
                         "functions": [
                             {
                                 "module": row["Module"],
-                                "name": "review_count",
-                                "args": {"value": row["Average Review Count"]}
+                                "name": name,
+                                "args": {"value": value}
                             }
                         ]
                     }
                 )
 
-        intent = string.Template(row["Intent"]).substitute(eval(row["Intent Dictionary"]))
-
-        name = "exp" + str(idx)
-        data = {
-            "task": {
-                "name": name,
-                "config": {
-                    "task_id": idx,
-                    "start_urls": list(row["Start URLs"]),
-                    "intent_template": row["Intent"].replace("$", "\\$"),
-                    "instantiation_dict": eval(row["Intent Dictionary"]),
-                    "intent": intent,
-                    "choices": choices,
-                    "intent_template_id": row["Intent Template ID"]
-                }
+    intent = substitute_intent(row["Intent"], row["Intent Dictionary"])
+
+    name = "exp" + str(idx)
+    data = {
+        "task": {
+            "name": name,
+            "config": {
+                "task_id": idx,
+                "start_urls": list(row["Start URLs"]),
+                "intent_template": row["Intent"].replace("$", "\\$"),
+                "instantiation_dict": dict(parse_intent_dictionary(row["Intent Dictionary"])),
+                "intent": intent,
+                "choices": choices,
+                "intent_template_id": row["Intent Template ID"]
             }
         }
-
-        if "coverage_type" in row:
-            data["task"]["config"]["metadata"] = {"coverage_type": row["coverage_type"]}
-        if "user_preference" in row:
-            data["task"]["config"]["metadata"] = {"user_preference": row["user_preference"]}
-
-        # Save to a YAML file
-        with open(f"{exp_dir}/{name}.yaml", "w") as f:
-            f.write("# @package _global_\n\n")
-            yaml.dump(
-                data,
-                f,
-                default_flow_style=False,
-                allow_unicode=True,
-                sort_keys=False,
-                indent=2
-            )
+    }
+
+    if "coverage_type" in row:
+        data["task"]["config"]["metadata"] = {"coverage_type": row["coverage_type"]}
+    if "user_preference" in row:
+        data["task"]["config"]["metadata"] = {"user_preference": row["user_preference"]}
+
+    # Save to a YAML file
+    with open(f"{exp_dir}/{name}.yaml", "w") as f:
+        f.write("# @package _global_\n\n")
+        f.write("\n".join(format_yaml(data)) + "\n")
+
+def format_yaml(value, indent=""):
+    """
+    Formats a config as block-style YAML lines, like yaml.dump(default_flow_style=False).
+
+    Configs only hold dicts, lists and scalars, so this skips PyYAML's representers. Strings are
+    always written as JSON strings, which are valid double-quoted YAML scalars.
+    """
+    if isinstance(value, dict):
+        lines = []
+        for key, item in value.items():
+            key = format_yaml_key(key)
+            if isinstance(item, dict) and item:
+                lines.append(f"{indent}{key}:")
+                lines.extend(format_yaml(item, indent + "  "))
+            elif isinstance(item, list) and item:
+                lines.append(f"{indent}{key}:")
+                lines.extend(format_yaml(item, indent))
+            else:
+                lines.append(f"{indent}{key}: {format_yaml_scalar(item)}")
+        return lines
+
+    if isinstance(value, list):
+        lines = []
+        for item in value:
+            if isinstance(item, (dict, list)) and item:
+                item_lines = format_yaml(item, indent + "  ")
+                lines.append(indent + "- " + item_lines[0][len(indent) + 2:])
+                lines.extend(item_lines[1:])
+            else:
+                lines.append(f"{indent}- {format_yaml_scalar(item)}")
+        return lines
+
+    return [indent + format_yaml_scalar(value)]
+
+def format_yaml_key(key):
+    # Plain keys, unless YAML would read them as something else than a string (e.g. on, null)
+    if SIMPLE_KEY.match(key) and key.lower() not in ("true", "false", "yes", "no", "on", "off", "null"):
+        return key
+    return format_yaml_string(key)
+
+def format_yaml_scalar(value):
+    if value is None:
+        return "null"
+    if isinstance(value, (bool, np.bool_)):
+        return "true" if value else "false"
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if math.isnan(value):
+            return ".nan"
+        if math.isinf(value):
+            return ".inf" if value > 0 else "-.inf"
+        # YAML 1.1 floats need a dot, e.g. 1e+16 must be written as 1.0e+16
+        text = repr(value)
+        return text if "." in text else text.replace("e", ".0e")
+    if isinstance(value, dict):
+        return "{}"
+    if isinstance(value, list):
+        return "[]"
+    return format_yaml_string(str(value))
+
+def format_yaml_string(value):
+    text = json.dumps(value, ensure_ascii=False)
+    if value.isprintable():
+        return text
+    return YAML_ESCAPED.sub(lambda match: escape_yaml_char(match.group()), text)
+
+def escape_yaml_char(char):
+    code = ord(char)
+    if code < 0x100:
+        return f"\\x{code:02x}"
+    if code < 0x10000:
+        return f"\\u{code:04x}"
+    return f"\\U{code:08x}"
 
 def main():
     parser = argparse.ArgumentParser(description="Generates all experiment configs.")
@@ -354,7 +508,7 @@ def main():
 
     args = parser.parse_args()
     dotenv.load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.env"))
-    dspy.configure(lm=dspy.LM(args.model, temperature=0.1))
+    dspy.configure(lm=dspy.LM(args.model, temperature=0.1, max_tokens=MAX_TOKENS))
 
     generate_experiments(
         args.exp_dir,
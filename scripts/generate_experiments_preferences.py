@@ -27,7 +27,6 @@ but including the user preferences.
 
 import os
 import argparse
-import string
 import yaml
 import pandas as pd
 import numpy as np
@@ -35,8 +34,16 @@ import itertools
 import random
 import dspy
 import dotenv
-from tqdm import tqdm
-from generate_experiments import save_configs, VariableSubstitution
+from generate_experiments import (
+    save_configs,
+    get_substitution_map,
+    apply_substitutions,
+    cross_join,
+    read_csv,
+    to_categorical,
+    VariableSubstitution,
+    MAX_TOKENS
+)
 
 SEED = 42
 EXP_DIR = "conf/experiment"
@@ -52,6 +59,13 @@ NO_NUDGE_PREFERENCES = [
     "The user doesn't put much stock in what other customers think."
 ]
 
+def with_preferences(df, preferences):
+    # Same rows and order as concatenating one copy of df per preference, with a single take
+    positions = np.tile(np.arange(len(df)), len(preferences))
+    return df.iloc[positions].reset_index(drop=True).assign(
+        user_preference=np.repeat(preferences, len(df))
+    )
+
 def generate_experiments(
         exp_dir,
         products,
@@ -71,8 +85,8 @@ def generate_experiments(
         category_context = f.read()
 
     # Load CSV files
-    df_intents = pd.read_csv("tasks/intents.csv")
-    df_interventions = pd.read_csv("tasks/interventions-preferences.csv")
+    df_intents = read_csv("tasks/intents.csv")
+    df_interventions = read_csv("tasks/interventions-preferences.csv")
 
     # Include the intent template ID
     df_intents = df_intents.reset_index().rename(columns={"index": "Intent Template ID"})
@@ -94,20 +108,24 @@ def generate_experiments(
         how="left"
     )
 
-    df_products = pd.read_csv(products)
+    df_products = read_csv(products)
 
     print("=" * 50)
     print(f"Loaded {len(df_products)} product pairs")
     print(f"Loaded {len(df_tasks[df_tasks['Starting Point'] == 'Product'])} interventions")
 
     # Create pairs of Start URLs
-    df_products["Start URLs"] = list(zip(df_products["product1_url"], df_products["product2_url"]))
-    df_products["Start URLs"] = df_products["Start URLs"].apply(
-        lambda t: tuple(random.sample(t, len(t))) # Shuffle
-    )
+    df_products["Start URLs"] = [
+        tuple(random.sample(urls, len(urls))) # Shuffle
+        for urls in zip(df_products["product1_url"], df_products["product2_url"])
+    ]
+
+    # Only carry the columns used below (and by save_configs) through the cross join and duplications
+    df_tasks = df_tasks[["Intent Template ID", "Intent", "Nudge", "Intervention", "Variables", "Module", "Name"]]
+    df_products = df_products[["category", "Start URLs"]]
 
     # Combine with start urls in other dataframe
-    df_tasks_all = df_tasks.merge(df_products, how="cross")
+    df_tasks_all = cross_join(to_categorical(df_tasks), to_categorical(df_products))
 
     # Empty intent dictionary
     df_tasks_all["Intent Dictionary"] = "{}"
@@ -119,72 +137,39 @@ def generate_experiments(
     print(f"Generating interventions with LLM calls...")
     llm_call = dspy.ChainOfThought(VariableSubstitution)
 
-    unique_intervention_category = df_tasks_all[
-        ~df_tasks_all["Variables"].isna()
-    ][["category", "Intervention", "Variables"]].drop_duplicates()
-
-    substitution_map = {}
-    for _, row in tqdm(unique_intervention_category.iterrows(),
-                       total=len(unique_intervention_category)):
-        # Generate substituted intervention
-        new_intervention = string.Template(row["Intervention"]).substitute(
-            {
-                row["Variables"]: llm_call(
-                    intervention=row["Intervention"],
-                    variable=row["Variables"],
-                    category=row["category"],
-                    category_context=category_context
-                ).value
-            }
-        )
-
-        # Store mapping from original to substituted intervention
-        substitution_map[(row["category"], row["Intervention"])] = new_intervention
+    # Substitutions only depend on (category, Intervention, Variables), so take the unique
+    # combinations from the inputs instead of deduplicating the whole cross join
+    unique_intervention_category = cross_join(
+        df_tasks.loc[df_tasks["Variables"].notna(), ["Intervention", "Variables"]].drop_duplicates(),
+        df_products[["category"]].drop_duplicates()
+    )[["category", "Intervention", "Variables"]]
+
+    substitution_map = get_substitution_map(unique_intervention_category, llm_call, category_context)
 
     # Apply substitutions to original dataframe
-    df_tasks_all["Intervention"] = df_tasks_all.apply(
-        lambda row: substitution_map.get(
-            (row["category"], row["Intervention"]),
-            row["Intervention"]
-        ),
-        axis=1
-    )
+    df_tasks_all = apply_substitutions(df_tasks_all, substitution_map)
 
     if not combine:
         ### NUDGE PREFERENCES
 
         # We need to duplicate the product tasks to nudge both L/R tabs
         # Create duplicated rows with Nudge Index 0..N (number of elements in Start URLs - 1)
-        df_tasks_nudge = df_tasks_all.loc[
-            df_tasks_all.index.repeat(
-                df_tasks_all["Start URLs"].str.len()
-            )
-        ].copy()
-        df_tasks_nudge["Nudge Index"] = df_tasks_all.groupby(
-            df_tasks_all.index
-        ).apply(
-            lambda x: list(range(len(x.iloc[0]["Start URLs"])))
-        ).explode().astype(int).values
+        lens = df_tasks_all["Start URLs"].str.len().to_numpy()
+        df_tasks_nudge = df_tasks_all.loc[df_tasks_all.index.repeat(lens)]
+        # Position of each copy within its task, i.e. 0..len - 1 restarting at every task
+        df_tasks_nudge["Nudge Index"] = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens)
 
         # Duplicate task configs with the NUDGE_PREFERENCES personas
-        df_tasks_nudge = pd.concat([
-            df_tasks_nudge.assign(user_preference=NUDGE_PREFERENCES[0]),
-            df_tasks_nudge.assign(user_preference=NUDGE_PREFERENCES[1])
-        ], ignore_index=True)
+        df_tasks_nudge = with_preferences(df_tasks_nudge, NUDGE_PREFERENCES)
 
     ### NO NUDGE PREFERENCES
 
     # Duplicate task configs with the NO_NUDGE_PREFERENCES personas
-    df_tasks_no_nudge = df_tasks_all.copy()
+    df_tasks_no_nudge = df_tasks_all
     if combine is not None:
         df_tasks_no_nudge = df_tasks_no_nudge.assign(user_preference=combine)
     else:
-        df_tasks_no_nudge = pd.concat([
-            df_tasks_no_nudge.assign(user_preference=NO_NUDGE_PREFERENCES[0]),
-            df_tasks_no_nudge.assign(user_preference=NO_NUDGE_PREFERENCES[1]),
-            df_tasks_no_nudge.assign(user_preference=NO_NUDGE_PREFERENCES[2]),
-            df_tasks_no_nudge.assign(user_preference=NO_NUDGE_PREFERENCES[3])
-        ], ignore_index=True)
+        df_tasks_no_nudge = with_preferences(df_tasks_no_nudge, NO_NUDGE_PREFERENCES)
 
     # Combine all configs
     if combine is not None:
@@ -195,10 +180,7 @@ def generate_experiments(
             ignore_index=True
         ).reset_index(drop=True)
 
-    df_tasks_all["Intent"] = df_tasks_all.apply(
-        lambda row: row["Intent"] + "\n" + row["user_preference"],
-        axis=1
-    )
+    df_tasks_all["Intent"] = df_tasks_all["Intent"].astype(str) + "\n" + df_tasks_all["user_preference"]
 
     print(f"Generating {len(df_tasks_all)} product configs")
 
@@ -253,7 +235,7 @@ def main():
 
     args = parser.parse_args()
     dotenv.load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.env"))
-    dspy.configure(lm=dspy.LM(args.model, temperature=0.1))
+    dspy.configure(lm=dspy.LM(args.model, temperature=0.1, max_tokens=MAX_TOKENS))
 
     generate_experiments(
         args.exp_dir,
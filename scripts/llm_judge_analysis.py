@@ -31,20 +31,22 @@ import os
 import dotenv
 import dspy
 import concurrent.futures
-import json
+import orjson
 import ast
+import functools
 from tqdm import tqdm
 from collections import Counter
 from pydantic import BaseModel, Field
 
-def combine_columns(df, suffix):
-    cols = [col for col in df.columns if col.startswith("step_") and col.endswith(f".{suffix}")]
-    return df[cols].agg(lambda x: " ".join([str(v) for v in x if pd.notnull(v)]), axis=1)
+def combine_columns(steps, suffix):
+    # Steps are a list of dicts per experiment, parsed from the "steps" JSON column (see collect_results.py)
+    return steps.map(lambda x: " ".join([str(step[suffix]) for step in x if step.get(suffix) is not None]))
 
-def extract_nudge_from_row(row):
-    """Extract nudge value from row configuration."""
-    choices = ast.literal_eval(row["cfg.task.config.choices"])
-    if len(choices) > 0 and choices[0]["nudge"] not in ["Matching Price", "Matching Review Count"]:
+@functools.lru_cache(maxsize=None)
+def extract_nudge(choices_config):
+    """Extract nudge value from the choices configuration (cached, since many rows share it)."""
+    choices = ast.literal_eval(choices_config)
+    if len(choices) > 0 and choices[0]["nudge"] not in ["Matching Price", "Matching Review Count", "Matching Price and Review Count"]:
         return choices[0]["functions"][0]["args"]["value"]
     return None
 
@@ -61,38 +63,43 @@ class DecisionOutput(BaseModel):
     reasons: list[str] = Field(description="List of deciding factors from: price, rating, nudge, other. Rating includes review count.")
     justification: str = Field(description="Justification quoting from the original thinking or memory text")
 
-class MentionsAnalysis(dspy.Signature):
-    """Analyze what factors are mentioned in thinking and memory data. You should only answer true if a factor is mentioned explicitly."""
+class CombinedAnalysis(dspy.Signature):
+    """Analyze the thinking and memory data of an agent that chose a particular product.
 
-    thinking: str = dspy.InputField(desc="The agent's thinking process")
-    memory: str = dspy.InputField(desc="The agent's memory/notes")
-    nudge: str = dspy.InputField(desc="The explicit nudge value shown to agent")
+    Mentions: indicate what factors are mentioned in thinking and memory data. You should only answer true if a factor is mentioned explicitly.
 
-    mentions: MentionsOutput = dspy.OutputField(desc="Boolean indicators for what factors were mentioned")
-
-class DecidingFactorAnalysis(dspy.Signature):
-    """Determine the deciding factors from thinking and memory data to choose a particular product. Multiple factors can be selected if they all contributed to the decision. The nudge is only a deciding factor if it's mentioned explicitly. Avoid mistaking the nudge with other factors, since they could be related. The justifcation should quote from thinking or memory."""
+    Decision: determine the deciding factors to choose a particular product. Multiple factors can be selected if they all contributed to the decision. The nudge is only a deciding factor if it's mentioned explicitly. Avoid mistaking the nudge with other factors, since they could be related. The justifcation should quote from thinking or memory."""
 
     thinking: str = dspy.InputField(desc="The agent's thinking process")
     memory: str = dspy.InputField(desc="The agent's memory/notes")
     nudge: str = dspy.InputField(desc="The explicit nudge value shown to agent")
 
+    mentions: MentionsOutput = dspy.OutputField(desc="Boolean indicators for what factors were mentioned")
     decision: DecisionOutput = dspy.OutputField(desc="Deciding factors (reasons list) and justification with quotes. If one attribute is the same across comparisons, then it's NOT a deciding factor.")
 
-def run_analysis(signature_class, all_think, all_memory, nudge_value, output_field, post_process_fn=None):
-    """Generic analysis function that can handle both mentions and deciding factor analysis."""
-    predictor = dspy.Predict(signature_class)
-    result = predictor(
-        thinking=all_think,
-        memory=all_memory,
-        nudge=str(nudge_value)
-    )
-    parsed_result = getattr(result, output_field)
+class AnalysisItem(BaseModel):
+    """Input structure for one row of a batched analysis."""
+    thinking: str = Field(description="The agent's thinking process")
+    memory: str = Field(description="The agent's memory/notes")
+    nudge: str = Field(description="The explicit nudge value shown to agent")
 
-    if post_process_fn:
-        parsed_result = post_process_fn(parsed_result)
+class CombinedOutput(BaseModel):
+    """Output structure for one row of a batched analysis."""
+    mentions: MentionsOutput = Field(description="Boolean indicators for what factors were mentioned")
+    decision: DecisionOutput = Field(description="Deciding factors (reasons list) and justification with quotes. If one attribute is the same across comparisons, then it's NOT a deciding factor.")
 
-    return parsed_result
+class BatchCombinedAnalysis(dspy.Signature):
+    items: list[AnalysisItem] = dspy.InputField(desc="Independent agent runs to analyze")
+    results: list[CombinedOutput] = dspy.OutputField(desc="One analysis per item, in the same order as the items")
+
+# Same instructions as the single-row analysis, applied to each item on its own
+BatchCombinedAnalysis = BatchCombinedAnalysis.with_instructions(
+    CombinedAnalysis.instructions + "\n\nAnalyze each item independently of the others."
+)
+
+# Predictors are stateless across calls, so they are built once and shared by all worker threads
+predictor = dspy.Predict(CombinedAnalysis)
+batch_predictor = dspy.Predict(BatchCombinedAnalysis)
 
 def post_process_mentions(parsed_result):
     """Convert Pydantic model to dict."""
@@ -107,71 +114,110 @@ def post_process_deciding_factor(parsed_result):
         "justification": parsed_result.justification
     }
 
-def analyze_mentions(all_think, all_memory, nudge_value):
-    return run_analysis(MentionsAnalysis, all_think, all_memory, nudge_value,
-                       "mentions", post_process_mentions)
-
-def analyze_deciding_factor(all_think, all_memory, nudge_value):
-    return run_analysis(DecidingFactorAnalysis, all_think, all_memory, nudge_value,
-                       "decision", post_process_deciding_factor)
+def analyze_combined(all_think, all_memory, nudge_value):
+    """Runs both analyses with a single LLM call, returning (mentions, decision) dicts."""
+    result = predictor(
+        thinking=all_think,
+        memory=all_memory,
+        nudge=str(nudge_value)
+    )
+    return post_process_mentions(result.mentions), post_process_deciding_factor(result.decision)
+
+def analyze_batch(items):
+    """Runs the combined analysis for several (all_think, all_memory, nudge_value) items with a single LLM call."""
+    result = batch_predictor(items=[
+        AnalysisItem(thinking=all_think, memory=all_memory, nudge=str(nudge_value))
+        for all_think, all_memory, nudge_value in items
+    ])
+    if len(result.results) != len(items):
+        raise ValueError(f"Expected {len(items)} results, got {len(result.results)}")
+    return [
+        (post_process_mentions(output.mentions), post_process_deciding_factor(output.decision))
+        for output in result.results
+    ]
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("csv", help="Path to input CSV file with aggregated results")
     parser.add_argument("--model", default="gpt-5-mini")
-    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--max-workers", type=int, default=32, help="Number of concurrent LLM requests")
+    parser.add_argument("--batch-size", type=int, default=1, help="Rows analyzed per LLM request")
+    parser.add_argument("--cache", action="store_true", help="Reuse judgements for identical inputs, within and across runs")
     args = parser.parse_args()
 
     # Load environment variables from .env file
     dotenv.load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.env"))
 
+    # DSPy puts the signature instructions in the system message and the per-row inputs after it,
+    # so the prompt prefix is the same for every row. OpenAI caches it automatically, while
+    # Anthropic needs an explicit cache breakpoint on the system message.
+    lm_kwargs = {}
+    if "claude" in args.model or args.model.startswith("anthropic/"):
+        lm_kwargs["cache_control_injection_points"] = [{"location": "message", "role": "system"}]
+
     # Configure dspy with the specified model
     dspy.configure(lm=dspy.LM(
         model=args.model,
-        additional_drop_params=["max_tokens", "temperature"]
+        additional_drop_params=["max_tokens", "temperature"],
+        **lm_kwargs
     ))
 
+    # Off by default, so each run gets fresh judgements
     dspy.configure_cache(
-        enable_disk_cache=False,
-        enable_memory_cache=False,
+        enable_disk_cache=args.cache,
+        enable_memory_cache=args.cache,
     )
 
     # Load collected results
     df = pd.read_csv(args.csv)
-    df["all_think"] = combine_columns(df, "think")
-    df["all_memory"] = combine_columns(df, "memory")
 
     # Filter only the ones which added to cart
     df = df[df["final_step.elem_info.attrs.id"].notnull()]
     df = df[df["final_step.elem_info.attrs.id"].map(lambda x: "addtocart" in x)]
 
-    def process_row_with_analysis(row, analysis_fn):
-        """Generic function to process a row with any analysis function."""
-        nudge = extract_nudge_from_row(row)
-        result = analysis_fn(row["all_think"], row["all_memory"], nudge)
-        result["experiment_id"] = row.get("experiment_id")
-        result["intervention"] = nudge
-        return result
-
-    def run_parallel_analysis(rows, analysis_fn, description, max_workers):
-        """Run analysis in parallel and return results."""
-        print(f"\n{description}...")
-        results = []
-        process_fn = lambda row: process_row_with_analysis(row, analysis_fn)
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            for result in tqdm(
-                    executor.map(process_fn, rows),
-                    total=len(rows),
-                    desc=description
-            ):
-                results.append(result)
+    # Parse the steps once for both columns, and only for the rows we keep
+    steps = df["steps"].map(orjson.loads)
+    df = df.assign(
+        all_think=combine_columns(steps, "think"),
+        all_memory=combine_columns(steps, "memory")
+    )
+
+    def process_rows(rows):
+        """Analyze a batch of rows, tagging both results with the experiment and intervention."""
+        nudges = [extract_nudge(row["cfg.task.config.choices"]) for row in rows]
+        try:
+            if len(rows) == 1:
+                results = [analyze_combined(rows[0]["all_think"], rows[0]["all_memory"], nudges[0])]
+            else:
+                results = analyze_batch([
+                    (row["all_think"], row["all_memory"], nudge) for row, nudge in zip(rows, nudges)
+                ])
+        except Exception as e:
+            if len(rows) == 1:
+                raise
+            # Retry with smaller batches, so a bad response only affects a few rows
+            print(f"Batch of {len(rows)} rows failed ({e}), splitting it")
+            half = len(rows) // 2
+            return process_rows(rows[:half]) + process_rows(rows[half:])
+
+        for row, nudge, row_results in zip(rows, nudges, results):
+            for result in row_results:
+                result["experiment_id"] = row.get("experiment_id")
+                result["intervention"] = nudge
         return results
 
     # Run both analyses
+    print("\nAnalyzing mentions and deciding factors...")
     rows = df.to_dict("records")
-    results_mentions = run_parallel_analysis(rows, analyze_mentions, "Analyzing mentions", args.max_workers)
-    results_reasons = run_parallel_analysis(rows, analyze_deciding_factor, "Analyzing deciding factors", args.max_workers)
+    batches = [rows[i:i + args.batch_size] for i in range(0, len(rows), args.batch_size)]
+    results_mentions, results_reasons = [], []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.max_workers) as executor, \
+            tqdm(total=len(rows), desc="Analyzing mentions and deciding factors") as progress:
+        for results in executor.map(process_rows, batches):
+            for mentions, reasons in results:
+                results_mentions.append(mentions)
+                results_reasons.append(reasons)
+            progress.update(len(results))
     total_rows = len(results_mentions)
 
     # Print stats
@@ -204,8 +250,8 @@ def main():
         }
     }
 
-    with open(output_file, 'w') as f:
-        json.dump(detailed_results, f, indent=2)
+    with open(output_file, 'wb') as f:
+        f.write(orjson.dumps(detailed_results, option=orjson.OPT_INDENT_2))
     print(f"\nDetailed results saved to: {output_file}")
 
 if __name__ == "__main__":
@@ -28,6 +28,7 @@ import functools
 import requests
 import lzma
 import base64
+import zstandard
 from bs4 import BeautifulSoup
 from enum import Enum
 
@@ -42,10 +43,14 @@ class PageType(Enum):
     OTHER = "other"
 
 
+# Shared across calls (and threads) to reuse connections to the same host
+session = requests.Session()
+
+
 @functools.lru_cache(maxsize=128)
 def get_html(url: str) -> str:
     # Fetch HTML content of the page, avoiding redundant repeated requests by caching the result
-    response = requests.get(url)
+    response = session.get(url)
     if response.status_code != 200:
         raise Exception(f"Failed to fetch the page: {response.status_code}")
     return response.text
@@ -179,14 +184,22 @@ def get_all_category_metadata(soup: BeautifulSoup) -> list:
 # Functions for HTML Compression & Decompression
 # ============================================
 
+# Frames start with these bytes, so older lzma (xz) data can still be decompressed
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+@functools.lru_cache(maxsize=64)
 def compress_html(html_content: str) -> str:
     """Compress HTML content and return base64 encoded string."""
     html_bytes = html_content.encode("utf-8")
-    compressed = lzma.compress(html_bytes, preset=9)
+    compressed = zstandard.compress(html_bytes, level=3)
     return base64.b64encode(compressed).decode("ascii")
 
 def decompress_html(compressed_data: str) -> str:
-    """Decompress base64 encoded compressed HTML."""
+    """Decompress base64 encoded compressed HTML (zstd, or lzma from older results)."""
     compressed_bytes = base64.b64decode(compressed_data.encode("ascii"))
-    html_bytes = lzma.decompress(compressed_bytes)
+    if compressed_bytes.startswith(ZSTD_MAGIC):
+        html_bytes = zstandard.decompress(compressed_bytes)
+    else:
+        html_bytes = lzma.decompress(compressed_bytes)
     return html_bytes.decode("utf-8")
@@ -24,8 +24,12 @@
 This script processes aggregated results to make them ready for the analysis in R.
 """
 
+import ast
+import functools
 import logging
 import argparse
+import orjson
+import numpy as np
 import pandas as pd
 from urllib.parse import urlparse
 from tqdm.auto import tqdm
@@ -45,11 +49,19 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# The config columns are Python reprs (not JSON), and most rows share the same values,
+# so each distinct string is only parsed once
+parse_literal = functools.lru_cache(maxsize=None)(ast.literal_eval)
+
+# The R analysis selects step_1.url to step_10.url, so at least step_0..step_10 are written
+NUM_STEP_COLUMNS = 11
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--input_files", type=str, nargs='+', required=True, help="Input CSV file paths")
     parser.add_argument("--output_file", type=str, required=True, help="Output CSV file path for processed data")
-    parser.add_argument("--num_workers", type=int, default=8, help="(Maximum) number of parallel workers for fetching data")
+    parser.add_argument("--num_workers", type=int, default=32, help="(Maximum) number of parallel workers for fetching data")
     parser.add_argument("--product_list", type=str, help="Optional list of product URLs to include metadata.")
     args = parser.parse_args()
 
@@ -57,7 +69,7 @@ def main():
     df = pd.concat(df_list, ignore_index=True)
 
     # Filter to pairs
-    df["cfg.task.config.start_urls"] = df["cfg.task.config.start_urls"].map(eval)
+    df["cfg.task.config.start_urls"] = df["cfg.task.config.start_urls"].map(parse_literal)
     df = df[df["cfg.task.config.start_urls"].map(len) == 2].copy()
     logger.info("Found %d pairs with exactly 2 start URLs", len(df))
 
@@ -67,10 +79,10 @@ def main():
         product_map = {urlparse(url).path: category for url, category in product_map.items()}
         df["category"] = df["cfg.task.config.start_urls"].map(lambda urls: product_map[urlparse(urls[0]).path])
 
-    df["choices"] = df["cfg.task.config.choices"].map(eval)
+    df["choices"] = df["cfg.task.config.choices"].map(parse_literal)
 
     # Identify nudged choice
-    nudge_types_to_ignore = ["Matching Review Count", "Matching Price"]
+    nudge_types_to_ignore = ["Matching Review Count", "Matching Price", "Matching Price and Review Count"]
 
     df["nudged_choice_url"] = df["choices"].map(
         lambda x: x[0]["url"] if ((len(x) > 0) and (x[0]["nudge"] not in nudge_types_to_ignore)) else None
@@ -83,10 +95,7 @@ def main():
         lambda x: x[0]["functions"][0]["args"]["value"] if ((len(x) > 0) and (x[0]["nudge"] not in nudge_types_to_ignore)) else None
     )
 
-    df["chose_nudged_product"] = df.apply(
-        lambda row: row["final_step.url"] == row["nudged_choice_url"],
-        axis=1
-    )
+    df["chose_nudged_product"] = df["final_step.url"] == df["nudged_choice_url"]
 
     # Fetch product data
     df = fetch_product_data_parallel(df, max_workers=args.num_workers)
@@ -97,14 +106,14 @@ def main():
     df_reg["nudge_trial"] = df_reg["nudged_choice_url"].notnull()
 
     # Get product indices
-    df_reg["nudged_idx"] = df_reg.apply(
-        lambda row: row["cfg.task.config.start_urls"].index(row["nudged_choice_url"]) if row["nudge_trial"] else None,
-        axis=1
-    ).astype("Int64")
-    df_reg["chose_idx"] = df_reg.apply(
-        lambda row: row["cfg.task.config.start_urls"].index(row["final_step.url"]) if row["final_step.url"] in row["cfg.task.config.start_urls"] else None,
-        axis=1
-    ).astype("Int64")
+    df_reg["nudged_idx"] = pd.Series([
+        urls.index(url) if trial else None
+        for urls, url, trial in zip(df_reg["cfg.task.config.start_urls"], df_reg["nudged_choice_url"], df_reg["nudge_trial"])
+    ], index=df_reg.index, dtype="Int64")
+    df_reg["chose_idx"] = pd.Series([
+        urls.index(url) if url in urls else None
+        for urls, url in zip(df_reg["cfg.task.config.start_urls"], df_reg["final_step.url"])
+    ], index=df_reg.index, dtype="Int64")
     df_reg["other_idx"] = 1 - df_reg["nudged_idx"]
 
     # Remove any invalid choices
@@ -112,32 +121,28 @@ def main():
     df_reg = df_reg[df_reg["final_step.elem_info.attrs.id"].notnull()]
     df_reg = df_reg[df_reg["final_step.elem_info.attrs.id"].map(lambda x: "addtocart" in x)]
 
+    # Pairs have exactly two products, so prices and ratings fit in (n, 2) arrays
+    prices = np.array(df_reg["prices"].tolist(), dtype=float).reshape(-1, 2)
+    ratings = np.array(df_reg["ratings"].tolist(), dtype=float).reshape(-1, 2)
+    rows = np.arange(len(df_reg))
+    nudge_trial = df_reg["nudge_trial"].to_numpy()
+    nudged_idx = df_reg["nudged_idx"].fillna(0).to_numpy(dtype=int)
+    chose_idx = df_reg["chose_idx"].to_numpy(dtype=int)
+
     # Extract prices and ratings based on nudged/other product
-    df_reg["price_nudged"] = df_reg.apply(lambda row: row["prices"][row["nudged_idx"]] if row["nudge_trial"] else None, axis=1)
-    df_reg["price_other"] = df_reg.apply(lambda row: row["prices"][row["other_idx"]] if row["nudge_trial"] else None, axis=1)
-    df_reg["rating_nudged"] = df_reg.apply(lambda row: row["ratings"][row["nudged_idx"]] if row["nudge_trial"] else None, axis=1)
-    df_reg["rating_other"] = df_reg.apply(lambda row: row["ratings"][row["other_idx"]] if row["nudge_trial"] else None, axis=1)
+    df_reg["price_nudged"] = np.where(nudge_trial, prices[rows, nudged_idx], np.nan)
+    df_reg["price_other"] = np.where(nudge_trial, prices[rows, 1 - nudged_idx], np.nan)
+    df_reg["rating_nudged"] = np.where(nudge_trial, ratings[rows, nudged_idx], np.nan)
+    df_reg["rating_other"] = np.where(nudge_trial, ratings[rows, 1 - nudged_idx], np.nan)
 
-    df_reg["avg_price"] = df_reg["prices"].apply(lambda x: sum(x) / len(x))
-    df_reg["price_diff_lr"] = df_reg["prices"].apply(lambda x: abs(x[1] - x[0]))
+    df_reg["avg_price"] = prices.mean(axis=1)
+    df_reg["price_diff_lr"] = np.abs(prices[:, 1] - prices[:, 0])
     df_reg["price_diff_lr_pct"] = df_reg["price_diff_lr"] / df_reg["avg_price"]
 
-    df_reg["chose_cheaper"] = df_reg.apply(
-        lambda row: row["prices"][row["chose_idx"]] < row["prices"][1 - row["chose_idx"]],
-        axis=1
-    )
-    df_reg["cheaper_idx"] = df_reg.apply(
-        lambda row: min(enumerate(row["prices"]), key=lambda x: x[1])[0],
-        axis=1
-    )
-    df_reg["better_rated_idx"] = df_reg.apply(
-        lambda row: max(enumerate(row["ratings"]), key=lambda x: x[1])[0],
-        axis=1
-    )
-    df_reg["chose_better_rated"] = df_reg.apply(
-        lambda row: row["ratings"][row["chose_idx"]] > row["ratings"][1 - row["chose_idx"]],
-        axis=1
-    )
+    df_reg["chose_cheaper"] = prices[rows, chose_idx] < prices[rows, 1 - chose_idx]
+    df_reg["cheaper_idx"] = prices.argmin(axis=1)
+    df_reg["better_rated_idx"] = ratings.argmax(axis=1)
+    df_reg["chose_better_rated"] = ratings[rows, chose_idx] > ratings[rows, 1 - chose_idx]
 
     # Calculate differences
     df_reg["price_diff"] = df_reg["price_nudged"] - df_reg["price_other"]
@@ -149,6 +154,16 @@ def main():
     # Create model_family column
     df_reg["model_family"] = df_reg["study.chat_model_args.model_name"]
 
+    # Flat step URL columns (step_0.url, step_1.url, ...), as read by the R analysis
+    # (analysis/data_prep.R and analysis/plots.R use step_1.url to step_10.url)
+    step_urls = pd.DataFrame(
+        [[step.get("url") for step in orjson.loads(steps)] for steps in df_reg["steps"]],
+        index=df_reg.index
+    )
+    step_urls = step_urls.reindex(columns=range(max(NUM_STEP_COLUMNS, step_urls.shape[1])))
+    step_urls.columns = [f"step_{i}.url" for i in step_urls.columns]
+    df_reg = pd.concat([df_reg, step_urls], axis=1)
+
     # Save the processed data for further inspection
     df_reg.to_csv(args.output_file, index=False)
     logger.info("Saved preprocessed data to %s", args.output_file)
@@ -164,30 +179,25 @@ def fetch_single_product_data(url: str) -> tuple[str, float, float]:
         return url, 0.0, 0.0
 
 
-def fetch_product_data_parallel(df: pd.DataFrame, max_workers: int = 8) -> pd.DataFrame:
+def fetch_product_data_parallel(df: pd.DataFrame, max_workers: int = 32) -> pd.DataFrame:
     logger.info("Fetching product ratings and prices with %d workers", max_workers)
 
-    all_urls = set()
-    for urls in df["cfg.task.config.start_urls"]:
-        all_urls.update(urls)
-    all_urls = list(all_urls)
+    all_urls = df["cfg.task.config.start_urls"].explode()
 
-    url_data = {}
+    results = []
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(fetch_single_product_data, url): url for url in all_urls}
+        futures = [executor.submit(fetch_single_product_data, url) for url in all_urls.unique()]
 
         with tqdm(total=len(futures), desc="Fetching product data") as pbar:
             for future in as_completed(futures):
-                url, rating, price = future.result()
-                url_data[url] = {"rating": rating, "price": price}
+                results.append(future.result())
                 pbar.update(1)
 
-    df["ratings"] = df["cfg.task.config.start_urls"].map(
-        lambda urls: [url_data[url]["rating"] for url in urls]
-    )
-    df["prices"] = df["cfg.task.config.start_urls"].map(
-        lambda urls: [url_data[url]["price"] for url in urls]
-    )
+    # Look up each start URL and gather the values back into one list per row
+    url_df = pd.DataFrame(results, columns=["url", "rating", "price"]).set_index("url")
+    url_values = url_df.reindex(all_urls.to_numpy()).set_axis(all_urls.index).groupby(level=0)
+    df["ratings"] = url_values["rating"].agg(list)
+    df["prices"] = url_values["price"].agg(list)
 
     return df
 
@@ -0,0 +1,76 @@
+# Copyright (c) 2025
+# Manuel Cherep <mcherep@mit.edu>
+# Nikhil Singh <nikhil.u.singh@dartmouth.edu>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides utilities for finding and loading experiment results.
+"""
+
+import os
+import json
+import orjson
+import yaml
+from typing import Any, Iterator
+
+# The libyaml parser is much faster, but PyYAML may be built without it
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+def find_summary_files(results_dir: str, _depth: int = 0) -> Iterator[str]:
+    """
+    Yields the summary_info.json files below results_dir, same as globbing
+    "**/*/summary_info.json" recursively (hidden directories are skipped and
+    symlinked directories are followed too).
+
+    This walks the tree with os.scandir, which gets the entry types from the
+    directory listing itself instead of calling stat() on every path (only
+    symlinks need one, to check what they point to).
+    """
+    with os.scandir(results_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                yield from find_summary_files(entry.path, _depth + 1)
+            elif _depth > 0 and entry.name == "summary_info.json":
+                yield entry.path
+
+
+def load_json(path: str) -> Any:
+    """
+    Loads a JSON file with orjson, falling back to json for the NaN/Infinity
+    literals that json.dump writes (e.g. in summary_info.json stats).
+    """
+    with open(path, "rb") as json_file:
+        data = json_file.read()
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(data)
+
+
+def load_yaml(path: str) -> Any:
+    """Loads a YAML file like yaml.safe_load, using libyaml when available."""
+    with open(path, "rb") as yaml_file:
+        return yaml.load(yaml_file, Loader=SafeLoader)
@@ -67,40 +67,68 @@ def process_experiment(args):
     if len(start_urls) <= 1:
         return None
 
-    task = {}
-    for idx, url in enumerate(start_urls):
-        name = f"{exp_name}_{idx}"
-
-        # Simulate environment
-        env = ABxLabBrowserEnv(
-            task_entrypoint=StaticPageTask,
-            task_kwargs={
-                "url": url,
-                "config": exp_cfg.task.config
-            },
-            headless=True,
-        )
-        env.reset()
-
-        # Save screenshot
-        env.page.screenshot(
-            path=os.path.join(output_dir, f"{name}.png"),
-            full_page=True,
-            clip={
-                "x": 0,
-                "y": 250,
-                "width": 1280,
-                "height": 900
-            },
-            scale="device"
-        )
+    # Screenshot encoding
+    screenshot_format = cfg_dict["study"].get("screenshot_format", "png")
+    screenshot_ext = "jpg" if screenshot_format == "jpeg" else "png"
+    screenshot_kwargs = {"type": screenshot_format}
+    if screenshot_format == "jpeg":
+        screenshot_kwargs["quality"] = cfg_dict["study"].get("screenshot_quality", 90)
+
+    # Simulate environment once, which also loads the first URL
+    env = ABxLabBrowserEnv(
+        task_entrypoint=StaticPageTask,
+        task_kwargs={
+            "url": start_urls[0],
+            "config": exp_cfg.task.config
+        },
+        headless=True,
+    )
+
+    # Same timeout as the env's own context (the env's value, if set, overrides the task's)
+    timeout = env.timeout if env.timeout is not None else env.task.timeout
 
+    task = {}
+    try:
+        for idx, url in enumerate(start_urls):
+            name = f"{exp_name}_{idx}"
+
+            context = None
+            try:
+                if idx == 0:
+                    page = env.page
+                else:
+                    # Reuse the browser, but load each URL in a fresh context with the same routes
+                    context = env.browser.new_context(viewport=env.task.viewport)
+                    context.set_default_timeout(timeout)
+                    if env.env_config and "choices" in env.env_config:
+                        env.setup_route_handler(context)
+                    page = context.new_page()
+                    page.goto(url)
+                    page.wait_for_load_state("networkidle")
+
+                # Save screenshot
+                page.screenshot(
+                    path=os.path.join(output_dir, f"{name}.{screenshot_ext}"),
+                    full_page=True,
+                    clip={
+                        "x": 0,
+                        "y": 250,
+                        "width": 1280,
+                        "height": 900
+                    },
+                    scale="device",
+                    **screenshot_kwargs
+                )
+            finally:
+                if context is not None:
+                    context.close()
+
+            task[f"image_{idx}"] = os.path.join(host_path, f"{name}.{screenshot_ext}")
+            task[f"url_{idx}"] = url
+    finally:
         env.browser.close()
         del env
 
-        task[f"image_{idx}"] = os.path.join(host_path, f"{name}.png")
-        task[f"url_{idx}"] = url
-
     task["exp"] = exp_name
     choices = exp_cfg.task.config.choices
     if choices: